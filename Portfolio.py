@@ -1,6 +1,9 @@
 import streamlit as st
 from PIL import Image
 
+from energy import assets, profiling
+from energy.service import prefetch
+
 # Page Configurations
 st.set_page_config(
     page_title="Noâm Detournay Portfolio",
@@ -8,9 +11,16 @@ st.set_page_config(
     layout="wide",
 )
 
+profiler = profiling.start("Portfolio")
+
+# The landing page is the first script a new server runs: start loading the
+# dataset now, so the visualization pages find it ready
+prefetch()
+
 # Sidebar
 st.sidebar.title("Noâm Detournay")
-st.sidebar.image("profile_picture.jpg", use_column_width=True)  
+# Pre-sized WebP/JPEG variants of the 1.5 MB photo, sized for the sidebar
+assets.responsive_image("profile_picture.jpg", st.sidebar, alt="Noâm Detournay")
 st.sidebar.markdown("""
 **Data Scientist | ML Engineer**  
 I'm passionate about harnessing the power of data and AI to solve real-world problems.
@@ -18,6 +28,7 @@ I'm passionate about harnessing the power of data and AI to solve real-world pro
 st.sidebar.markdown("[GitHub](https://github.com/NoamDetournay)")
 st.sidebar.markdown("[LinkedIn](https://linkedin.com/in/noam-detournay)")
 st.sidebar.markdown("[Contact Me](mailto:noam.detournay@orange.fr)")
+profiler.mark("sidebar")
 
 # Main Title
 st.title("Welcome to My Portfolio 👋")
@@ -76,3 +87,6 @@ with col2:
     - Developed a patent classification model using Natural Language Processing (NLP) techniques.
     - **Tools**: PyTorch, TensorFlow, Python, Streamlit.
     """)
+
+profiler.mark("content")
+profiler.finish()
@@ -0,0 +1 @@
+"""Benchmarks of the Streamlit pages; see bench_pages.py."""
@@ -0,0 +1,182 @@
+"""Headless benchmark of the Streamlit pages.
+
+Drives Portfolio.py and both pages with `streamlit.testing.v1.AppTest` against
+a synthetic copy of the ODRE export, and reports for each dataset scale:
+
+- cold start: first run with an empty snapshot directory (parse and store)
+- warm start: first run of a new server process on an existing snapshot
+- warm reruns: one rerun per widget change
+- Plotly payload: bytes of figure JSON sent by a full run of the page
+- peak resident memory of the process that ran the scale
+
+Usage, from the repository root:
+
+    python -m benchmarks.bench_pages --scales 1 10 --output bench.json
+
+Every scale runs in its own subprocess, since the data layer reads its
+settings from the environment when it is imported.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = {
+    "Portfolio": "Portfolio.py",
+    "Monthly": os.path.join("pages", "1-Monthly-Visualization.py"),
+    "Daily": os.path.join("pages", "2-Daily-Visualization.py"),
+}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def payload_bytes(at):
+    return sum(len(chart.proto.spec) for chart in at.get("plotly_chart"))
+
+
+def timed_run(at, timeout):
+    start = time.perf_counter()
+    at.run(timeout=timeout)
+    if at.exception:
+        raise RuntimeError(f"Page raised: {[e.value for e in at.exception]}")
+    return time.perf_counter() - start
+
+
+def widget_changes(at):
+    """Yield (name, action) for one change of every selectbox and checkbox."""
+    for i in range(len(at.selectbox)):
+        box = at.selectbox[i]
+        if len(box.options) > 1:
+            option = box.options[-1] if box.index == 0 else box.options[0]
+            yield f"selectbox: {box.label}", lambda at, i=i, option=option: at.selectbox[i].set_value(option)
+    for i in range(len(at.checkbox)):
+        yield f"checkbox: {at.checkbox[i].label}", lambda at, i=i: at.checkbox[i].set_value(not at.checkbox[i].value)
+
+
+def bench_page(path, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT_DIR, path), default_timeout=timeout)
+    first_run = timed_run(at, timeout)
+    result = {"first_run_seconds": first_run, "payload_bytes": payload_bytes(at), "reruns": {}}
+    for name, change in list(widget_changes(at)):
+        change(at)
+        result["reruns"][name] = {"seconds": timed_run(at, timeout), "payload_bytes": payload_bytes(at)}
+    return result
+
+
+def clear_process_caches():
+    # What a fresh server process starts with: empty Streamlit caches, same disk
+    import streamlit as st
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+
+def run_scale(csv_path, cache_dir, timeout):
+    """Benchmark every page on one dataset; runs inside the worker process."""
+    report = {"pages": {}}
+    for phase in ("cold", "warm"):
+        clear_process_caches()
+        for name, path in PAGES.items():
+            page = bench_page(path, timeout)
+            entry = report["pages"].setdefault(name, {})
+            entry[f"{phase}_start_seconds"] = page["first_run_seconds"]
+            if phase == "warm":
+                entry["payload_bytes"] = page["payload_bytes"]
+                entry["reruns"] = page["reruns"]
+    report["snapshot_bytes"] = sum(os.path.getsize(os.path.join(root, f))
+                                   for root, _, files in os.walk(cache_dir) for f in files)
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def worker(args):
+    report = run_scale(args.csv, os.environ["ENERGY_CACHE_DIR"], args.timeout)
+    json.dump(report, sys.stdout)
+
+
+def bench_scale(scale, work_dir, timeout):
+    from benchmarks.synthetic import write_csv
+
+    csv_path = os.path.join(work_dir, f"odre-x{scale}.csv")
+    if not os.path.exists(csv_path):
+        rows = write_csv(csv_path, scale=scale)
+    else:
+        with open(csv_path, encoding="utf-8") as f:
+            rows = sum(1 for _ in f) - 1
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as cache_dir:
+        env = {**os.environ,
+               "ENERGY_DATASET_URL": csv_path,
+               "ENERGY_API_URL": "",
+               "ENERGY_CACHE_DIR": cache_dir,
+               "ENERGY_PROFILE": "0"}
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_pages", "--worker", "--csv", csv_path,
+             "--timeout", str(timeout)],
+            cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=False)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark of scale {scale} failed:\n{completed.stderr}")
+    # The report is the last line; anything printed before it is not ours
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report["csv_rows"] = rows
+    report["csv_bytes"] = os.path.getsize(csv_path)
+    return report
+
+
+def environment():
+    import pandas
+    import plotly
+    import pyarrow
+    import streamlit
+
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "pandas": pandas.__version__, "pyarrow": pyarrow.__version__,
+            "plotly": plotly.__version__, "streamlit": streamlit.__version__}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1],
+                        help="dataset sizes, as multiples of the real history (default: 1)")
+    parser.add_argument("--work-dir", default=os.path.join(ROOT_DIR, ".cache", "bench"),
+                        help="where synthetic exports are generated and kept between runs")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds allowed for one page run")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return worker(args)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    report = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "environment": environment(), "scales": {}}
+    for scale in args.scales:
+        print(f"Benchmarking scale x{scale}...", file=sys.stderr)
+        report["scales"][str(scale)] = bench_scale(scale, args.work_dir, args.timeout)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
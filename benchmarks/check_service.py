@@ -0,0 +1,113 @@
+"""End-to-end check of the dataset service against the HTTP stand-in.
+
+Serves a synthetic export from `benchmarks.http_standin`, throttled so the
+download takes a few seconds, and checks that:
+
+- concurrent refreshes during the download share one future and one download
+- a refresh past the TTL revalidates the export and gets a 304
+- a new service on the same snapshot, as after a restart, serves it at once,
+  then revalidates it without downloading it again
+
+Usage, from the repository root:
+
+    python -m benchmarks.check_service --rate 2
+
+Exits with status 1 if a check fails.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from benchmarks.http_standin import ExportStandIn
+from benchmarks.synthetic import generate_year
+
+# Refreshes started at once, as by visitors opening the app together
+VISITORS = 5
+# Seconds a restarted service may take to serve the snapshot
+RESTART_SECONDS = 1.0
+
+
+def concurrent_refreshes(service, count=VISITORS):
+    """Call `service.refresh()` from `count` threads at once; return the futures."""
+    barrier = threading.Barrier(count)
+    futures = [None] * count
+
+    def visit(i):
+        barrier.wait()
+        futures[i] = service.refresh()
+
+    threads = [threading.Thread(target=visit, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return futures
+
+
+def run_checks(directory, years, rate_mb):
+    from energy.service import DatasetService
+    from energy.store import PartitionedStore
+
+    path = os.path.join(directory, "export.csv")
+    pd.concat([generate_year(year) for year in years]).to_csv(path, sep=';', index=False)
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    server = ExportStandIn(path, rate_mb=rate_mb).start()
+    try:
+        store = PartitionedStore(os.path.join(directory, "snapshot"))
+        service = DatasetService(server.url, store)
+        futures = concurrent_refreshes(service)
+        check(all(future is futures[0] for future in futures), f"{VISITORS} concurrent refreshes share one future")
+        start = time.perf_counter()
+        dataset = futures[0].result()
+        check(server.downloads == 1, f"one download for {VISITORS} refreshes, "
+                                     f"{time.perf_counter() - start:.1f} s at {rate_mb} MB/s")
+
+        revalidated = service.refresh().result()
+        check(server.not_modified == 1 and server.downloads == 1, "revalidation gets a 304")
+        check(revalidated.version == dataset.version, "revalidation keeps the version")
+
+        # A restart: a new service on the same snapshot directory
+        restarted = DatasetService(server.url, PartitionedStore(store.directory))
+        start = time.perf_counter()
+        served = restarted.current()
+        elapsed = time.perf_counter() - start
+        check(served is not None and served.version == dataset.version and elapsed < RESTART_SECONDS,
+              f"restart serves the snapshot in {elapsed * 1000:.0f} ms")
+        restarted.refresh().result()
+        check(server.not_modified == 2 and server.downloads == 1, "restart revalidates without downloading")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, nargs=2, default=[2022, 2024], metavar=("FIRST", "LAST"),
+                        help="years of the synthetic export (default: 2022 2024)")
+    parser.add_argument("--rate", type=float, default=2, help="download rate in MB/s (default: 2)")
+    args = parser.parse_args(argv)
+
+    # Read by the data layer when it is imported: every refresh revalidates
+    # the export, and there is no records API to sync from
+    os.environ["ENERGY_CACHE_TTL"] = "0"
+    os.environ["ENERGY_API_URL"] = ""
+    with tempfile.TemporaryDirectory() as directory:
+        failures = run_checks(directory, range(args.years[0], args.years[1] + 1), args.rate)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""End-to-end check of the incremental sync against the records API stand-in.
+
+Builds a snapshot from a synthetic export cut short, then syncs the missing
+rows from the records endpoint of `benchmarks.http_standin`, which serves
+the whole export. Checks that:
+
+- the sync walks the pages with the `where date_heure > date'...'` cursor,
+  one request per page of `PAGE_SIZE` records and one empty page at the end
+- the synced snapshot is the one a full ingest of the export gives
+- `changed_months` lists the months of the new rows, and patching the cube
+  for them gives the cube built from scratch
+- a second sync finds nothing new in one request
+
+Usage, from the repository root:
+
+    python -m benchmarks.check_sync --days 40
+
+Exits with status 1 if a check fails.
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks.http_standin import ExportStandIn
+from benchmarks.synthetic import generate_year
+
+
+def write_exports(directory, years, days):
+    """Write the whole export and a copy without its last `days` days; return their paths."""
+    full = pd.concat([generate_year(year) for year in years], ignore_index=True)
+    stamps = pd.to_datetime(full['date_heure'], utc=True)
+    full_path = os.path.join(directory, "full.csv")
+    old_path = os.path.join(directory, "old.csv")
+    full.to_csv(full_path, sep=';', index=False)
+    full[stamps < stamps.max() - pd.Timedelta(days=days)].to_csv(old_path, sep=';', index=False)
+    return full_path, old_path
+
+
+def run_checks(directory, years, days):
+    from energy.cube import build_cube, load_cube
+    from energy.loader import Dataset, load_dataset
+    from energy.store import PartitionedStore, SnapshotStore
+    from energy.sync import PAGE_SIZE, sync
+
+    full_path, old_path = write_exports(directory, years, days)
+    failures = []
+
+    def check(condition, message):
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    store = PartitionedStore(os.path.join(directory, "snapshot"))
+    cubes = SnapshotStore(os.path.join(directory, "snapshot"), name="cube")
+    old = load_dataset(old_path, store=store, api_url=None)
+    load_cube(old, cubes)
+    reference = load_dataset(full_path, store=PartitionedStore(os.path.join(directory, "reference")), api_url=None)
+
+    server = ExportStandIn(full_path).start()
+    try:
+        result = sync(store, server.records_url)
+        new_rows, _ = server.records()
+        new_rows = new_rows[pd.to_datetime(new_rows['date_heure'], utc=True) > old.span[1]]
+        # A full last page is followed by an empty one
+        pages = math.floor(len(new_rows) / PAGE_SIZE) + 1
+        check(server.record_pages == pages, f"{len(new_rows)} new records fetched in {pages} pages "
+                                            f"(got {server.record_pages})")
+
+        synced = Dataset.from_store(store, store.read_meta())
+        check(result.rows_added == len(reference.frame) - len(old.frame),
+              f"{result.rows_added} rows added, as many as the export has more")
+        check(synced.version == reference.version, "synced version matches a full ingest")
+        check(synced.frame.equals(reference.frame) and synced.frame.dtypes.equals(reference.frame.dtypes),
+              "synced frame equals a full ingest")
+
+        stamps = reference.frame.index[reference.frame.index > old.span[1]]
+        months = sorted(set(zip(stamps.year, stamps.month)))
+        check([tuple(m) for m in result.changed_months] == months, f"changed months are {months}")
+        check(synced.meta["previous_version"] == cubes.read_meta()["version"], "cube can be patched")
+        patched = load_cube(synced, cubes)
+        check(patched.equals(build_cube(reference.frame)), "patched cube equals the cube built from scratch")
+
+        requests = server.record_pages
+        again = sync(store, server.records_url)
+        check(again.rows_added == 0 and server.record_pages == requests + 1, "second sync finds nothing new")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, nargs=2, default=[2023, 2024], metavar=("FIRST", "LAST"),
+                        help="years of the synthetic export (default: 2023 2024)")
+    parser.add_argument("--days", type=float, default=40, help="days of records left to the sync (default: 40)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        failures = run_checks(directory, range(args.years[0], args.years[1] + 1), args.days)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
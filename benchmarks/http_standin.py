@@ -0,0 +1,161 @@
+"""Local HTTP stand-in for the ODRE export and records API.
+
+Serves one CSV file with the ETag and Last-Modified validators of the real
+endpoint, answers conditional requests with 304, and can throttle the
+response to test the pages against a slow download:
+
+    python -m benchmarks.http_standin .cache/bench/odre-x1.csv --rate 2 --port 8502
+    ENERGY_DATASET_URL=http://127.0.0.1:8502/export.csv streamlit run Portfolio.py
+
+The rows of the same file are served at /records the way the records API
+pages them, for the incremental sync: `order_by=date_heure`, `limit` (at
+most 100) and a `where=date_heure > date'...'` bound.
+
+It counts the downloads and record pages it served, so tests can check that
+concurrent visitors share one download and how the sync walks the pages.
+"""
+import argparse
+import email.utils
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+# Largest `limit` the records API accepts
+MAX_LIMIT = 100
+WHERE = re.compile(r"date_heure\s*>\s*date'([^']+)'")
+
+
+class ExportStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, path, rate_mb=None, port=0, block=64 * 1024):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.file_path = path
+        self.rate = rate_mb * 1e6 if rate_mb else None
+        self.block = block
+        self.downloads = 0
+        self.not_modified = 0
+        self.record_pages = 0
+        self._lock = threading.Lock()
+        self._records = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/export.csv"
+
+    @property
+    def records_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/records"
+
+    def validators(self):
+        stat = os.stat(self.file_path)
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"', email.utils.formatdate(stat.st_mtime, usegmt=True)
+
+    def start(self):
+        """Serve from a daemon thread; return self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def records(self):
+        """Rows of the file sorted by `date_heure`, and their UTC timestamps; read once."""
+        with self._lock:
+            if self._records is None:
+                rows = pd.read_csv(self.file_path, sep=';')
+                stamps = pd.to_datetime(rows['date_heure'], utc=True)
+                order = stamps.argsort(kind='stable')
+                self._records = rows.iloc[order].reset_index(drop=True), stamps.iloc[order].reset_index(drop=True)
+            return self._records
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/records":
+            self._send_records(parse_qs(url.query))
+        else:
+            self._send_export()
+
+    def _send_records(self, query):
+        server = self.server
+        rows, stamps = server.records()
+        limit = int(query.get("limit", ["10"])[0])
+        if query.get("order_by", ["date_heure"])[0] != "date_heure" or not 0 < limit <= MAX_LIMIT:
+            self.send_error(400, "Only order_by=date_heure and a limit up to 100 are supported")
+            return
+        if "where" in query:
+            match = WHERE.fullmatch(query["where"][0].strip())
+            if match is None:
+                self.send_error(400, "Only a where=date_heure > date'...' bound is supported")
+                return
+            rows = rows[stamps > pd.Timestamp(match.group(1))]
+
+        server.count("record_pages")
+        # NaN as null, and floats with their full precision
+        results = rows.iloc[:limit].to_json(orient='records', force_ascii=False, double_precision=15)
+        body = f'{{"total_count": {len(rows)}, "results": {results}}}'.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_export(self):
+        server = self.server
+        etag, last_modified = server.validators()
+        if self.headers.get("If-None-Match") == etag or self.headers.get("If-Modified-Since") == last_modified:
+            server.count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        server.count("downloads")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(os.path.getsize(server.file_path)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        start = time.perf_counter()
+        sent = 0
+        with open(server.file_path, "rb") as f:
+            while block := f.read(server.block):
+                try:
+                    self.wfile.write(block)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                sent += len(block)
+                if server.rate:
+                    # Sleep until the bytes sent so far match the rate
+                    time.sleep(max(0.0, sent / server.rate - (time.perf_counter() - start)))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV file to serve, e.g. one written by benchmarks.synthetic")
+    parser.add_argument("--rate", type=float, help="throttle the download to this many MB/s")
+    parser.add_argument("--port", type=int, default=8502)
+    args = parser.parse_args(argv)
+
+    server = ExportStandIn(args.path, rate_mb=args.rate, port=args.port)
+    print(f"Serving {args.path} at {server.url}, and its records at {server.records_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
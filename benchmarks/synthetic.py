@@ -0,0 +1,60 @@
+"""Synthetic copy of the ODRE `consommation-quotidienne-brute` export.
+
+The file has the columns and formats of the real CSV export. Gas figures are
+hourly and electricity half-hourly, with seasonal and daily cycles. `scale`
+multiplies the number of rows: at scale 1 the history spans 2012-2024 with
+half-hourly records; larger scales keep the same calendar but shorten the
+time step, so every year, month and hour key still exists.
+"""
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['date_heure', 'date', 'heure', 'consommation_brute_gaz_grtgaz', 'statut_grtgaz',
+           'consommation_brute_gaz_terega', 'statut_terega', 'consommation_brute_gaz_totale',
+           'consommation_brute_electricite_rte', 'statut_rte', 'consommation_brute_totale']
+
+
+def generate_year(year, scale=1, seed=0):
+    step = pd.Timedelta(minutes=30) / scale
+    index = pd.date_range(f"{year}-01-01", f"{year + 1}-01-01", freq=step, tz='Europe/Paris', inclusive='left')
+    rng = np.random.default_rng(seed + year)
+
+    day_of_year = index.dayofyear.to_numpy()
+    hour = index.hour.to_numpy() + index.minute.to_numpy() / 60
+    winter = np.cos(2 * np.pi * (day_of_year - 15) / 365.25)
+    daily = np.sin(2 * np.pi * (hour - 7) / 24)
+
+    gas_grtgaz = 40000 + 25000 * winter + 4000 * daily + rng.normal(0, 1500, len(index))
+    gas_terega = 0.1 * gas_grtgaz + rng.normal(0, 300, len(index))
+    electricity = 55000 + 15000 * winter + 8000 * daily + rng.normal(0, 2000, len(index))
+
+    # Gas is published hourly: the other half-hours are empty, as in the export
+    hourly = index.minute.to_numpy() == 0
+    gas_grtgaz = np.where(hourly, gas_grtgaz.round(), np.nan)
+    gas_terega = np.where(hourly, gas_terega.round(), np.nan)
+    gas_total = gas_grtgaz + gas_terega
+    electricity = electricity.round()
+
+    return pd.DataFrame({
+        'date_heure': index.strftime('%Y-%m-%dT%H:%M:%S%z').str.replace(r'(\d\d)$', r':\1', regex=True),
+        'date': index.strftime('%Y-%m-%d'),
+        'heure': index.strftime('%H:%M'),
+        'consommation_brute_gaz_grtgaz': gas_grtgaz,
+        'statut_grtgaz': 'Définitif',
+        'consommation_brute_gaz_terega': gas_terega,
+        'statut_terega': 'Définitif',
+        'consommation_brute_gaz_totale': gas_total,
+        'consommation_brute_electricite_rte': electricity,
+        'statut_rte': 'Définitif',
+        'consommation_brute_totale': gas_total + electricity,
+    }, columns=COLUMNS)
+
+
+def write_csv(path, scale=1, first_year=2012, last_year=2024, seed=0):
+    """Write the synthetic export to `path` one year at a time; return the row count."""
+    rows = 0
+    for year in range(first_year, last_year + 1):
+        frame = generate_year(year, scale, seed)
+        frame.to_csv(path, sep=';', index=False, header=year == first_year, mode='w' if year == first_year else 'a')
+        rows += len(frame)
+    return rows
@@ -0,0 +1,10 @@
+"""Data layer shared by the energy consumption pages.
+
+Pages import what they use from the submodules. This package imports none
+of them, so the ingestion processes load pandas and pyarrow, not Streamlit.
+"""
+import pandas as pd
+
+# The dataset is shared between sessions without copies: derived frames must
+# never write through to it
+pd.set_option("mode.copy_on_write", True)
@@ -0,0 +1,202 @@
+"""Pre-sized variants of the images shown by the pages.
+
+The source photos are far larger than the sidebar that shows them. Each one
+is resized to a few widths and recompressed as WebP, with a JPEG fallback,
+on a worker thread the first time a server process shows it; until they are
+ready, pages show a copy of the source file. The files are named after a hash of the source and
+the encoding settings, and written to the `static` directory that Streamlit
+serves (`server.enableStaticServing`). Their URLs never change for the same
+content, so browsers cache them for good, and the `<picture>` srcset lets
+the browser download only the width it needs.
+
+Variants can also be generated before deploying:
+
+    python -m energy.assets profile_picture.jpg
+"""
+import hashlib
+import html
+import io
+import logging
+import os
+import re
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import streamlit as st
+from PIL import Image, ImageOps
+
+from energy import settings
+
+logger = logging.getLogger(__name__)
+
+# Streamlit serves <app dir>/static at app/static
+STATIC_DIR = os.path.join(settings.ROOT_DIR, "static")
+VARIANTS_DIR = os.path.join(STATIC_DIR, "images")
+STATIC_URL = "app/static/images"
+
+# The sidebar is 336px wide by default, less 1.5rem of padding on each side:
+# 1x, 2x and 3x screens, and a sidebar dragged to its 550px maximum
+SIDEBAR_WIDTH = 288
+WIDTHS = (288, 576, 864, 1100)
+
+# Encoder options by format, in order of preference: the last one is the
+# fallback for browsers that support none of the others. AVIF is left out:
+# Pillow cannot encode it and Streamlit serves it as text/plain
+FORMATS = {
+    "webp": {"quality": 80, "method": 6},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+}
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+# Images the static file handler serves with their own content type
+STATIC_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+ORIENTATION = 0x0112
+
+# Encoding the variants of a large photo takes seconds: never on the script thread
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="energy-assets")
+
+
+def image_variants(path, widths=WIDTHS, formats=FORMATS, directory=VARIANTS_DIR, write=True):
+    """Write the missing variants of the image at `path`; return them as {format: [(width, file name)]}.
+
+    Widths larger than the source are capped to it rather than upscaled.
+    With `write=False`, return None instead if a variant is missing.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = _digest(data, formats)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    os.makedirs(directory, exist_ok=True)
+
+    # Opening only reads the header: the pixels are decoded if a variant is missing
+    source = Image.open(io.BytesIO(data))
+    source_width = source.height if source.getexif().get(ORIENTATION) in (5, 6, 7, 8) else source.width
+    image = None
+    variants = {}
+    for fmt, options in formats.items():
+        variants[fmt] = []
+        for width in sorted({min(width, source_width) for width in widths}):
+            name = f"{stem}-{width}w.{digest}.{EXTENSIONS[fmt]}"
+            target = os.path.join(directory, name)
+            if not os.path.exists(target):
+                if not write:
+                    return None
+                if image is None:
+                    # Apply the EXIF rotation: the variants are written without metadata
+                    image = ImageOps.exif_transpose(source).convert("RGB")
+                _write_variant(image, width, fmt, options, target)
+            variants[fmt].append((width, name))
+
+    # Variants, and copies, of a previous version of the source
+    for name in os.listdir(directory):
+        match = re.fullmatch(rf"{re.escape(stem)}(?:-\d+w)?\.([0-9a-f]+)\.\w+", name)
+        if match and match.group(1) != digest:
+            os.remove(os.path.join(directory, name))
+    return variants
+
+
+def source_copy(path, formats=FORMATS, directory=VARIANTS_DIR):
+    """Copy the image at `path` as is next to its variants, unless it is there; return its file name."""
+    with open(path, "rb") as f:
+        data = f.read()
+    stem, extension = os.path.splitext(os.path.basename(path))
+    name = f"{stem}.{_digest(data, formats)}{extension.lower()}"
+    target = os.path.join(directory, name)
+    if not os.path.exists(target):
+        os.makedirs(directory, exist_ok=True)
+        _write_file(data, target)
+    return name
+
+
+def _digest(data, formats):
+    return hashlib.sha1(data + repr(sorted(formats.items())).encode()).hexdigest()[:12]
+
+
+def _write_variant(source, width, fmt, options, target):
+    height = round(source.height * width / source.width)
+    buffer = io.BytesIO()
+    source.resize((width, height), Image.LANCZOS).save(buffer, fmt.upper(), **options)
+    _write_file(buffer.getvalue(), target)
+
+
+def _write_file(data, target):
+    # Write next to the target then rename, so concurrent servers never serve a partial file
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, target)
+    logger.info("Wrote %s (%d bytes)", target, len(data))
+
+
+@st.cache_resource(show_spinner=False)
+def get_variants(path):
+    """Future of the variants of `path`, written on a worker thread if some are missing."""
+    variants = image_variants(path, write=False)
+    if variants is None:
+        future = _executor.submit(image_variants, path)
+        future.add_done_callback(_log_failure)
+        return future
+    future = Future()
+    future.set_result(variants)
+    return future
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error("Could not write image variants", exc_info=future.exception())
+
+
+def _url(name):
+    # The name already changes with the content; the ?v= argument makes the
+    # static file handler send a long max-age
+    return f"{STATIC_URL}/{name}?v={name.rsplit('.', 2)[1]}"
+
+
+def _srcset(entries):
+    return ", ".join(f"{_url(name)} {width}w" for width, name in entries)
+
+
+def _closest(entries, size):
+    # Smallest variant at least `size` pixels wide, or the largest one
+    return next((name for width, name in entries if width >= size), entries[-1][1])
+
+
+def picture_html(variants, size, alt=""):
+    """A `<picture>` picking among `variants` for an image `size` pixels wide on screen."""
+    *preferred, (_, fallback) = variants.items()
+    sources = "".join(f'<source type="image/{fmt}" srcset="{_srcset(entries)}" sizes="{size}px">'
+                      for fmt, entries in preferred)
+    return (f'<picture>{sources}'
+            f'<img src="{_url(_closest(fallback, size))}" srcset="{_srcset(fallback)}" sizes="{size}px" '
+            f'alt="{html.escape(alt)}" decoding="async" style="width: 100%; height: auto;">'
+            f'</picture>')
+
+
+def responsive_image(path, container=st, size=SIDEBAR_WIDTH, alt=""):
+    """Show the image at `path` in `container` from its pre-sized variants, or as is until they are written."""
+    future = get_variants(path)
+    variants = future.result() if future.done() and future.exception() is None else None
+    static = st.get_option("server.enableStaticServing")
+    if variants is not None and static:
+        container.markdown(picture_html(variants, size, alt), unsafe_allow_html=True)
+    elif variants is not None:
+        # Without static serving, send the fallback variant that fills the container
+        fallback = list(variants.values())[-1]
+        container.image(os.path.join(VARIANTS_DIR, _closest(fallback, size)), use_column_width=True)
+    elif static and path.lower().endswith(STATIC_EXTENSIONS):
+        # A link to a copy of the source: st.image would decode and resize it on this thread
+        container.markdown(f'<img src="{_url(source_copy(path))}" alt="{html.escape(alt)}" '
+                           f'style="width: 100%; height: auto;">', unsafe_allow_html=True)
+    else:
+        container.image(path, use_column_width=True)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    for path in (argv if argv is not None else sys.argv[1:]):
+        for fmt, entries in image_variants(path).items():
+            total = sum(os.path.getsize(os.path.join(VARIANTS_DIR, name)) for _, name in entries)
+            print(f"{path} {fmt}: {len(entries)} widths, {total / 1000:.0f} kB")
+
+
+if __name__ == "__main__":
+    main()
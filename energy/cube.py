@@ -0,0 +1,104 @@
+"""Aggregate cube of the consumption measures by year, month, day and hour.
+
+Every chart summary (monthly averages, annual sums, hourly and daily
+profiles...) is a roll-up of this cube, so reruns never group the raw rows.
+The cube is built once per data version and persisted next to the snapshot.
+"""
+import pandas as pd
+import streamlit as st
+
+from energy import schema, settings
+from energy.loader import Dataset
+from energy.profiling import tracked
+from energy.store import SnapshotStore
+
+RATIO = 'gas_to_electricity_ratio'
+MEASURES = [*schema.MEASURES, RATIO]
+KEYS = ['year', 'month', 'day', 'hour']
+STATS = ['sum', 'mean', 'count', 'min', 'max']
+
+
+def build_cube(df):
+    keys = [df['year'], df['month'], df['day'], df['hour']]
+    # Aggregate in float64: the snapshot stores float32, too coarse for yearly sums
+    values = df[schema.MEASURES].astype('float64')
+    values[RATIO] = values['consommation_brute_gaz_totale'] / values['consommation_brute_electricite_rte']
+
+    cube = values.groupby(keys).agg(STATS)
+    cube.columns = [f"{column}_{stat}" for column, stat in cube.columns]
+    return cube.reset_index()
+
+
+def update_cube(cube, dataset, changed_months):
+    # Rebuild only the (year, month) slices touched by an incremental sync
+    changed = pd.MultiIndex.from_tuples([tuple(m) for m in changed_months], names=['year', 'month'])
+    stale = pd.MultiIndex.from_frame(cube[['year', 'month']]).isin(changed)
+    rows = pd.concat([dataset.period(year, month) for year, month in changed])
+    return pd.concat([cube[~stale], build_cube(rows)]).sort_values(KEYS, ignore_index=True)
+
+
+def load_cube(dataset, store=None):
+    """Return the cube for `dataset`, reusing or patching the persisted one."""
+    store = store or SnapshotStore(settings.CACHE_DIR, name="cube")
+    meta = store.read_meta()
+    if meta is not None and meta["version"] == dataset.version:
+        return store.read()
+
+    if meta is not None and meta["version"] == dataset.meta.get("previous_version"):
+        cube = update_cube(store.read(), dataset, dataset.meta["changed_months"])
+    else:
+        # Year by year: the keys start with the year, so the pieces never overlap
+        cube = pd.concat([build_cube(dataset.period(year)) for year in dataset.years], ignore_index=True)
+    store.write(cube, version=dataset.version)
+    return cube
+
+
+def rollup(cube, by, stat='sum', columns=None):
+    """Aggregate the cube up to the `by` keys.
+
+    Means are recomputed from sums and counts so they match a mean over the
+    raw rows.
+    """
+    columns = columns or MEASURES
+    grouped = cube.groupby(by)
+    if stat == 'mean':
+        sums = grouped[[f"{c}_sum" for c in columns]].sum()
+        counts = grouped[[f"{c}_count" for c in columns]].sum()
+        return pd.DataFrame(sums.to_numpy() / counts.to_numpy(), index=sums.index, columns=columns)
+
+    how = 'sum' if stat == 'count' else stat
+    result = grouped[[f"{c}_{stat}" for c in columns]].agg(how)
+    result.columns = columns
+    return result
+
+
+def month_profiles(cube):
+    """Hour-of-day, day-of-month and ratio profiles of all twelve months at once.
+
+    Each profile is a month x (measure, hour or day) pivot of a single
+    roll-up, so one month's profile is a row lookup. Days a month does not
+    have are NaN.
+    """
+    return {
+        'hour': rollup(cube, ['month', 'hour']).unstack('hour'),
+        'day': rollup(cube, ['month', 'day']).unstack('day'),
+        'ratio': rollup(cube, ['month', 'day'], 'mean', columns=[RATIO]).unstack('day'),
+    }
+
+
+@tracked("cube", st.cache_resource(show_spinner=False, hash_funcs={Dataset: lambda d: d.version}, max_entries=2))
+def get_cube(dataset):
+    return load_cube(dataset)
+
+
+# Like the cubes, the summaries of the current and previous versions are
+# kept: the pages ask for three roll-ups per version (eight leave room for a
+# fourth), and one set of profiles
+@tracked("rollup", st.cache_data(show_spinner=False, hash_funcs={Dataset: lambda d: d.version}, max_entries=8))
+def get_rollup(dataset, by, stat='sum'):
+    return rollup(get_cube(dataset), by, stat)
+
+
+@tracked("profiles", st.cache_data(show_spinner=False, hash_funcs={Dataset: lambda d: d.version}, max_entries=2))
+def get_profiles(dataset):
+    return month_profiles(get_cube(dataset))
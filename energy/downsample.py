@@ -0,0 +1,75 @@
+"""Downsampling of long time series before they are sent to the browser.
+
+A chart cannot show more than a couple of points per horizontal pixel, so
+the series are reduced on the server with algorithms that keep the peaks:
+min/max bucketing (the extremes of every bucket) or LTTB (Largest Triangle
+Three Buckets).
+"""
+import numpy as np
+import pandas as pd
+
+from energy import settings
+
+
+def target_points(width=settings.CHART_WIDTH, per_pixel=2):
+    return int(width * per_pixel)
+
+
+def minmax_indices(y, n_out):
+    """Indices of the minimum and maximum of `n_out // 2` equal buckets."""
+    n = len(y)
+    n_buckets = max(n_out // 2, 1)
+    if n <= n_out:
+        return np.arange(n)
+
+    size = -(-n // n_buckets)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    lows = np.where(np.isnan(buckets), np.inf, buckets).argmin(axis=1) + offsets
+    highs = np.where(np.isnan(buckets), -np.inf, buckets).argmax(axis=1) + offsets
+
+    indices = np.unique(np.concatenate([[0, n - 1], lows, highs]))
+    return indices[indices < n]
+
+
+def lttb_indices(x, y, n_out):
+    """Indices picked by Largest Triangle Three Buckets, NaNs ignored."""
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= n_out or n_out < 3:
+        return valid
+    x = x[valid].astype(float)
+    y = y[valid]
+
+    edges = np.linspace(1, len(valid) - 1, n_out - 1).astype(int)
+    picked = np.empty(n_out, dtype=int)
+    picked[0], picked[-1] = 0, len(valid) - 1
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        next_hi = edges[i + 2] if i + 2 < len(edges) else len(valid)
+        next_x = x[hi:next_hi].mean()
+        next_y = y[hi:next_hi].mean()
+        prev_x, prev_y = x[picked[i]], y[picked[i]]
+        areas = np.abs((prev_x - next_x) * (y[lo:hi] - prev_y) - (prev_x - x[lo:hi]) * (next_y - prev_y))
+        picked[i + 1] = lo + areas.argmax()
+    return valid[picked]
+
+
+def downsample(frame, columns, n_out=None, method='minmax'):
+    """Reduce `columns` of a time-indexed frame to about `n_out` points each.
+
+    Returns a long frame with `date`, `variable` and `value` columns, the
+    shape `px.line` builds itself from a wide frame.
+    """
+    n_out = n_out or target_points()
+    x = frame.index.asi8
+    parts = []
+    for column in columns:
+        y = frame[column].to_numpy(dtype=float)
+        indices = minmax_indices(y, n_out) if method == 'minmax' else lttb_indices(x, y, n_out)
+        parts.append(pd.DataFrame({'date': frame.index[indices], 'variable': column, 'value': y[indices]}))
+    if not parts:
+        return pd.DataFrame(columns=['date', 'variable', 'value'])
+    return pd.concat(parts, ignore_index=True)
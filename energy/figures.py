@@ -0,0 +1,110 @@
+"""Process-wide LRU cache of serialised Plotly figures.
+
+Figures are keyed by chart id, the parameters the viewer picked and the data
+version, and stored as the JSON Streamlit sends to the browser. Viewers
+cycling through the same few months and years then get the figure without it
+being rebuilt or serialised again.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+import streamlit as st
+
+from energy import settings
+from energy.profiling import record_cache
+
+# Most figures kept, whatever their size
+MAX_FIGURES = 512
+# Streamlit versions whose `st.plotly_chart` internals `plotly_chart_json` mirrors
+PROTO_VERSIONS = ("1.39.",)
+
+
+class FigureCache:
+    def __init__(self, max_entries=MAX_FIGURES, max_bytes=settings.FIGURE_CACHE_MB * 1e6):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, build):
+        """Return the JSON of the figure for `key`, calling `build()` on a miss."""
+        with self._lock:
+            spec = self._entries.get(key)
+            if spec is not None:
+                self._entries.move_to_end(key)
+        if spec is not None:
+            record_cache("figures", hit=True)
+            return spec
+
+        # Built outside the lock: two sessions missing the same key both build it
+        spec = pio.to_json(build(), validate=False)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = spec
+                self._bytes += len(spec)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        record_cache("figures", hit=False)
+        return spec
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+FIGURES = FigureCache()
+
+
+def cached_figure(chart_id, params, dataset, build):
+    return FIGURES.get((chart_id, tuple(params), dataset.version), build)
+
+
+def plotly_chart_json(spec, use_container_width=False):
+    """Like `st.plotly_chart`, for a figure that is already serialised.
+
+    The proto is built directly only on the Streamlit versions it was
+    checked against; elsewhere, or if the internals do not match, the figure
+    pays for a round trip through `st.plotly_chart`.
+    """
+    if not st.__version__.startswith(PROTO_VERSIONS):
+        return _plotly_chart_round_trip(spec, use_container_width)
+    try:
+        from streamlit.elements.lib.form_utils import current_form_id
+        from streamlit.elements.lib.utils import compute_and_register_element_id
+        from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+
+        # Mirrors what st.plotly_chart does after its own `plotly.io.to_json` call
+        proto = PlotlyChartProto()
+        proto.use_container_width = use_container_width
+        proto.theme = "streamlit"
+        proto.form_id = current_form_id(st._main)
+        proto.spec = spec
+        proto.config = json.dumps({"showLink": False, "linkText": False})
+        proto.id = compute_and_register_element_id(
+            "plotly_chart",
+            user_key=None,
+            form_id=proto.form_id,
+            plotly_spec=proto.spec,
+            plotly_config=proto.config,
+            selection_mode=("points", "box", "lasso"),
+            is_selection_activated=False,
+            theme="streamlit",
+            use_container_width=use_container_width,
+        )
+        enqueue = st._main._enqueue
+    except (ImportError, AttributeError, TypeError, ValueError):
+        # Internals changed: nothing was sent yet, so fall back
+        return _plotly_chart_round_trip(spec, use_container_width)
+    return enqueue("plotly_chart", proto)
+
+
+def _plotly_chart_round_trip(spec, use_container_width):
+    return st.plotly_chart(pio.from_json(spec, skip_invalid=True), use_container_width=use_container_width)
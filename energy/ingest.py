@@ -0,0 +1,280 @@
+"""Bounded-memory ingestion of an ODRE CSV export into a partitioned store.
+
+The CSV is parsed by pyarrow a block at a time. A process pool converts the
+dates and cleans each block, then writes it out as pieces of its year (and
+region) partitions. Only a few blocks are in flight at once, so memory stays
+under the ceiling whatever the size of the export. The pieces of each
+partition are then merged into one sorted file, one window of time at a time.
+
+Started from the server, the pool runs in a child process the export is
+piped to, see `ingest_export`.
+"""
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.feather as feather
+
+from energy import settings
+from energy.schema import ARROW_TYPES, DTYPES, PARTITION_BY, STATUSES, USECOLS, calendar_meta, clean, memory_footprint
+from energy.store import PartitionedStore, frame_table, write_frame
+
+logger = logging.getLogger(__name__)
+
+# Memory a block in flight takes at its peak, counting its copies in the
+# reading process and in the worker, as a multiple of its size as CSV text
+EXPANSION = 10
+# Smallest block worth sending to a worker
+MIN_BLOCK = 1 << 20
+# Resident memory of a spawned worker before it gets a block: the
+# interpreter, pandas and pyarrow (measured at 107 MB)
+WORKER_MB = 110
+# Memory a window of a partition takes while it is merged (slices of the
+# pieces, sorted and deduplicated frame, Arrow copy), as a multiple of its size
+MERGE_EXPANSION = 5
+# Bytes piped to the ingestion process at a time
+PIPE_BLOCK = 1 << 20
+# Bytes at the start of each block loaded the way the pages used to, to
+# estimate what a default `pd.read_csv` of the whole export would take
+SAMPLE_BYTES = 64 * 1024
+
+
+def pool_size(memory_mb, workers):
+    """Workers to start, at most `workers`: together they may take half of `memory_mb` before any block."""
+    return max(0, min(workers, int(memory_mb / (2 * WORKER_MB))))
+
+
+def block_size(memory_mb, workers):
+    """Bytes of CSV per block, so that the workers and every block in flight fit under `memory_mb`."""
+    in_flight = max(1, 2 * workers)
+    return max(MIN_BLOCK, int((memory_mb - workers * WORKER_MB) * 1e6 / (EXPANSION * in_flight)))
+
+
+def csv_blocks(stream, block_bytes):
+    """Yield (table, default bytes) for the export read from `stream`, one block at a time.
+
+    The table holds the used columns of the block. The default bytes
+    estimate the memory the block would take read by `pd.read_csv` with all
+    its columns and default dtypes, as the pages did before `schema.USECOLS`.
+
+    The blocks are cut on line ends here rather than by pyarrow's streaming
+    reader, which reads ahead of its consumer and would hold most of a large
+    export in memory while the pool is busy.
+    """
+    header = stream.readline()
+    while block := stream.read(block_bytes):
+        block += stream.readline()
+        table = pacsv.read_csv(
+            pa.py_buffer(header + block),
+            read_options=pacsv.ReadOptions(use_threads=False),
+            parse_options=pacsv.ParseOptions(delimiter=';'),
+            convert_options=pacsv.ConvertOptions(include_columns=USECOLS, column_types=ARROW_TYPES))
+        yield table, default_footprint(header, block, table.num_rows)
+
+
+def default_footprint(header, block, rows):
+    """Memory of `rows` rows of the export loaded by `pd.read_csv` with its defaults, from a sample of `block`."""
+    sample = pd.read_csv(io.BytesIO(header + block[:block.find(b"\n", SAMPLE_BYTES) + 1 or None]), sep=';')
+    return int(memory_footprint(sample) / max(len(sample), 1) * rows)
+
+
+def clean_block(table, store, staging, number):
+    """Clean one block and write it as pieces of its partitions; return its stats."""
+    raw = table.to_pandas()
+    df = clean(raw)
+    keys = []
+    for key, part in df.groupby(store.partition_by, sort=False, observed=True):
+        key = tuple(value.item() if hasattr(value, "item") else value for value in key)
+        path = store.partition_path(staging, key).replace("data.feather", f"piece-{number:06d}.feather")
+        write_frame(part, path)
+        keys.append(key)
+    return {"keys": keys, "rows": len(df), "parsed_bytes": memory_footprint(raw), **calendar_meta(df)}
+
+
+def merge_pieces(store, staging, key, memory_mb=settings.INGEST_MEMORY_MB):
+    """Merge the pieces of one partition into its final file; return its entry for the metadata, and its size.
+
+    The pieces are sorted but overlap in time when the export is not. They
+    are merged one window of time at a time, each small enough for
+    `memory_mb`, so a partition of any size is merged under the ceiling.
+    """
+    path = store.partition_path(staging, key)
+    paths = sorted(glob.glob(os.path.join(os.path.dirname(path), "piece-*.feather")))
+    # Mapped, not read: the pages touched are page cache the kernel can drop
+    pieces = [feather.read_table(piece, memory_map=True) for piece in paths]
+    # Every piece is one record batch, so its timestamps are a view of the file
+    stamps = [piece.column('date_heure').chunk(0).view(pa.int64()).to_numpy() for piece in pieces]
+    rows = sum(len(piece) for piece in pieces)
+    window_rows = max(1, int(memory_mb * 1e6 / (MERGE_EXPANSION * sum(piece.nbytes for piece in pieces) / rows)))
+
+    # Cut the windows at quantiles of every `stride`-th timestamp of each
+    # piece: a window then holds at most a quarter more rows than planned
+    stride = max(1, window_rows // (4 * len(pieces)))
+    step = window_rows // stride
+    sample = np.sort(np.concatenate([piece_stamps[::stride] for piece_stamps in stamps]))
+    edges = [None, *np.unique(sample[step::step]), None]
+
+    # Blocks infer their own categories: every window must share the same
+    # ones, since an Arrow file holds one dictionary per column
+    dtypes = {**DTYPES, **{column: pd.CategoricalDtype(sorted(set().union(
+        *(piece.column(column).unique().to_pylist() for piece in pieces)) - {None}))
+        for column in STATUSES}}
+
+    digest = hashlib.sha1()
+    merged_rows = size = 0
+    with contextlib.ExitStack() as stack:
+        writer = None
+        for lo, hi in zip(edges, edges[1:]):
+            df = _merge_window(pieces, stamps, lo, hi, dtypes)
+            if df is None:
+                continue
+            # Rows are hashed one by one: this is `frame_digest` of the whole partition
+            digest.update(pd.util.hash_pandas_object(df).values.tobytes())
+            merged_rows += len(df)
+            size += memory_footprint(df)
+            table = frame_table(df)
+            del df
+            if writer is None:
+                # An uncompressed Arrow IPC file is a Feather file
+                writer = stack.enter_context(pa.ipc.new_file(path, table.schema))
+            writer.write_table(table)
+            del table
+
+    del pieces, stamps
+    for piece in paths:
+        os.remove(piece)
+    return {"key": list(key), "digest": digest.hexdigest(), "rows": merged_rows}, size
+
+
+def _merge_window(pieces, stamps, lo, hi, dtypes):
+    # Rows of every piece in [lo, hi), sorted and deduplicated; None if there are none
+    slices = []
+    for piece, piece_stamps in zip(pieces, stamps):
+        start = 0 if lo is None else np.searchsorted(piece_stamps, lo)
+        stop = len(piece_stamps) if hi is None else np.searchsorted(piece_stamps, hi)
+        if stop > start:
+            # Concatenating categoricals with different categories falls back to object
+            slices.append(piece.slice(start, stop - start).to_pandas().astype(dtypes))
+    if not slices:
+        return None
+    # Each step drops the previous copy before the next one is made
+    df = pd.concat(slices)
+    del slices
+    # Stable, so that of two rows with the same timestamp the later block wins
+    df = df.sort_index(kind='stable')
+    return df[~df.index.duplicated(keep='last')]
+
+
+def ingest_csv(stream, store, memory_mb=settings.INGEST_MEMORY_MB, workers=settings.INGEST_WORKERS, **meta):
+    """Write the CSV export read from `stream` as a new version of `store`; return its metadata.
+
+    With `workers=0` blocks are cleaned in the calling process. Fewer
+    workers than asked are started when `memory_mb` cannot hold them, see
+    `pool_size`. The workers are spawned, and import the `__main__` module
+    again: only call this with workers from a script guarded by
+    `if __name__ == "__main__"`, never from a Streamlit page, see
+    `ingest_export`.
+    """
+    workers = pool_size(memory_mb, workers)
+    staging = store.stage()
+    stats = []
+    default_total = 0
+    try:
+        blocks = csv_blocks(stream, block_size(memory_mb, workers))
+        if workers:
+            # Spawned, not forked: the calling process may run threads
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                pending = set()
+                for number, (table, default_bytes) in enumerate(blocks):
+                    if len(pending) >= 2 * workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        stats.extend(future.result() for future in done)
+                    pending.add(pool.submit(clean_block, table, store, staging, number))
+                    default_total += default_bytes
+                stats.extend(future.result() for future in pending)
+        else:
+            for number, (table, default_bytes) in enumerate(blocks):
+                stats.append(clean_block(table, store, staging, number))
+                default_total += default_bytes
+
+        keys = sorted({key for block in stats for key in block["keys"]})
+        merged = [merge_pieces(store, staging, key, memory_mb) for key in keys]
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # What reading the export used to take, what reading its used columns
+    # takes, and what the cleaned snapshot takes
+    memory = {"default_bytes": default_total,
+              "parsed_bytes": sum(block["parsed_bytes"] for block in stats),
+              "clean_bytes": sum(size for _, size in merged)}
+    years = sorted({year for block in stats for year in block["years"]})
+    months = sorted({month for block in stats for month in block["months"]})
+    logger.info("Ingested %d blocks into %d partitions", len(stats), len(keys))
+    return store.commit(staging, [entry for entry, _ in merged], memory=memory, years=years, months=months, **meta)
+
+
+def ingest_export(stream, store, memory_mb=settings.INGEST_MEMORY_MB, workers=settings.INGEST_WORKERS, **meta):
+    """Ingest the export read from `stream` into `store`; return the metadata of the new version.
+
+    Streamlit runs a page with the page module as `__main__`, which every
+    spawned worker would import, and so run, again. With workers, the pool is
+    started from a child Python process instead, whose `__main__` is a
+    one-line command, and the export is piped to it.
+    """
+    if not pool_size(memory_mb, workers):
+        return ingest_csv(stream, store, memory_mb, 0, **meta)
+
+    command = [sys.executable, "-c", "from energy.ingest import main; main()",
+               os.path.abspath(store.directory), "--name", store.name, "--partition-by", *store.partition_by,
+               "--memory", str(memory_mb), "--workers", str(workers), "--meta", json.dumps(meta)]
+    child = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=settings.ROOT_DIR)
+    try:
+        try:
+            with child.stdin:
+                shutil.copyfileobj(stream, child.stdin, PIPE_BLOCK)
+        except BrokenPipeError:
+            # The child stopped reading: its exit code tells why
+            pass
+        output = child.stdout.read()
+        code = child.wait()
+    except BaseException:
+        # Never let the child commit a truncated export
+        child.kill()
+        child.wait()
+        raise
+    finally:
+        child.stdout.close()
+    if code:
+        raise ChildProcessError(f"Ingestion process exited with code {code}")
+    return json.loads(output)
+
+
+def main(argv=None):
+    """Ingest a CSV export read from standard input; print the metadata of the new version."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("directory", help="directory of the partitioned store")
+    parser.add_argument("--name", default="consommation")
+    parser.add_argument("--partition-by", nargs="+", default=PARTITION_BY)
+    parser.add_argument("--memory", type=float, default=settings.INGEST_MEMORY_MB, help="memory ceiling in MB")
+    parser.add_argument("--workers", type=int, default=settings.INGEST_WORKERS)
+    parser.add_argument("--meta", type=json.loads, default={}, help="JSON object added to the metadata")
+    args = parser.parse_args(argv)
+
+    store = PartitionedStore(args.directory, args.name, args.partition_by)
+    meta = ingest_csv(sys.stdin.buffer, store, args.memory, args.workers, **args.meta)
+    print(json.dumps(meta))
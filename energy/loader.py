@@ -0,0 +1,248 @@
+"""Download, clean and cache the ODRE consumption dataset.
+
+The export is streamed into a local snapshot, partitioned by year, that
+every session maps read-only, so a restart never has to download and parse
+it again. Pages reach it through `energy.service`, and only map the years
+they show.
+"""
+import io
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import requests
+
+from energy import settings
+from energy.ingest import ingest_export
+from energy.profiling import record_cache
+from energy.schema import SCHEMA_VERSION, TIMEZONE
+from energy.store import PartitionedStore, tables_to_frame
+from energy.sync import sync
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the network or disk at a time
+READ_BLOCK = 1 << 20
+
+
+class Dataset:
+    """Read-only handle on one version of a partitioned snapshot, shared by all sessions.
+
+    A dataset maps all its partitions when it is created, so it stays
+    readable after a later sync prunes its version, and builds the frame of
+    a year the first time it is asked for.
+    """
+
+    def __init__(self, store, meta, tables):
+        self.version = meta["version"]
+        # Snapshot metadata, e.g. which months changed since the previous version
+        self.meta = meta
+        self._store = store
+        # Memory-mapped table of every partition, by key
+        self._tables = tables
+        self._frame = None
+        self._years = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_store(cls, store, meta):
+        keys = [tuple(entry["key"]) for entry in meta["partitions"]]
+        return cls(store, meta, store.map_partitions(meta["version"], keys))
+
+    @property
+    def frame(self):
+        """The whole history, as a copy made on first use."""
+        with self._lock:
+            if self._frame is None:
+                self._frame = tables_to_frame(list(self._tables.values()))
+        # Every caller gets its own view; with copy-on-write, changing it
+        # copies the touched columns instead of writing to the shared data
+        return self._frame.copy(deep=False)
+
+    @property
+    def years(self):
+        return self.meta["years"]
+
+    @property
+    def months(self):
+        return self.meta["months"]
+
+    @property
+    def span(self):
+        """First and last timestamps of the history."""
+        return self.period(self.years[0]).index[0], self.period(self.years[-1]).index[-1]
+
+    def keys(self, years=None):
+        """Partition keys of the snapshot, limited to `years`."""
+        keys = [tuple(entry["key"]) for entry in self.meta["partitions"]]
+        if years is None:
+            return keys
+        position = self._store.partition_by.index('year')
+        return [key for key in keys if key[position] in set(years)]
+
+    def read_table(self, years=None, columns=None):
+        """Arrow table of `years`, mapped from their partitions; None if there are none."""
+        tables = [self._tables[key] for key in self.keys(years)]
+        if columns is not None:
+            tables = [table.select(columns) for table in tables]
+        return pa.concat_tables(tables) if tables else None
+
+    def column(self, name):
+        """One column over the whole history, as a NumPy array."""
+        return self.read_table(columns=[name]).column(name).to_numpy()
+
+    def period(self, year, month=None):
+        """Rows of one year, or of one month of it, sliced from the sorted index."""
+        frame = self._year(year)
+        if month is None:
+            # A view of its own: columns added to it must not reach other sessions
+            return frame.copy(deep=False)
+        start = pd.Timestamp(year, month, 1, tz=TIMEZONE)
+        lo, hi = frame.index.searchsorted([start, start + pd.DateOffset(months=1)])
+        return frame.iloc[lo:hi]
+
+    def _year(self, year):
+        with self._lock:
+            if year not in self._years:
+                keys = self.keys([year])
+                if keys:
+                    self._years[year] = tables_to_frame([self._tables[key] for key in keys])
+                else:
+                    # No data that year: an empty frame with the columns of the others
+                    self._years[year] = tables_to_frame([self._tables[self.keys()[0]]]).iloc[:0]
+            return self._years[year]
+
+
+class _BlockStream(io.RawIOBase):
+    """Readable file over an iterator of byte blocks, reporting progress as it goes."""
+
+    def __init__(self, blocks, total=None, progress=None):
+        self._blocks = blocks
+        self._block = memoryview(b"")
+        self._progress = progress
+        self.total = total
+        self.read_bytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._block:
+            block = next(self._blocks, None)
+            if block is None:
+                return 0
+            self._block = memoryview(block)
+        n = min(len(buffer), len(self._block))
+        buffer[:n] = self._block[:n]
+        self._block = self._block[n:]
+        self.read_bytes += n
+        if self._progress:
+            self._progress(self.read_bytes, self.total)
+        return n
+
+
+def _file_blocks(path):
+    with open(path, "rb") as f:
+        yield from iter(lambda: f.read(READ_BLOCK), b"")
+
+
+def _response_blocks(response):
+    with response:
+        yield from response.iter_content(READ_BLOCK)
+
+
+def _stream(blocks, total=None, progress=None):
+    return io.BufferedReader(_BlockStream(blocks, total, progress), READ_BLOCK)
+
+
+def fetch_export(url, etag=None, last_modified=None, progress=None):
+    """Return (stream, validators), or (None, validators) if unchanged.
+
+    The export is downloaded while the stream is read; `progress` is called
+    with the bytes read so far and the total, when it is known.
+    """
+    if not url.startswith(("http://", "https://")):
+        mtime = str(os.path.getmtime(url))
+        if mtime == last_modified:
+            return None, {"last_modified": mtime}
+        return _stream(_file_blocks(url), os.path.getsize(url), progress), {"last_modified": mtime}
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = requests.get(url, headers=headers, timeout=settings.HTTP_TIMEOUT, stream=True)
+    validators = {"etag": response.headers.get("ETag", etag),
+                  "last_modified": response.headers.get("Last-Modified", last_modified)}
+    if response.status_code == 304:
+        response.close()
+        return None, validators
+    response.raise_for_status()
+    total = int(response.headers.get("Content-Length", 0)) or None
+    return _stream(_response_blocks(response), total, progress), validators
+
+
+def read_snapshot(store):
+    """The dataset in the local snapshot, however old, or None."""
+    meta = store.read_meta()
+    if meta is None or meta.get("schema") != SCHEMA_VERSION:
+        return None
+    return Dataset.from_store(store, meta)
+
+
+def load_dataset(url=settings.DATASET_URL, store=None, ttl=settings.CACHE_TTL, offline=settings.OFFLINE,
+                 api_url=settings.API_URL, sync_interval=settings.SYNC_INTERVAL, progress=None):
+    """Return the cleaned dataset, refreshing the local snapshot when it is stale.
+
+    Within the TTL the snapshot is kept current with incremental syncs every
+    `sync_interval` seconds; past it the full export is revalidated.
+    `progress` follows the download, see `fetch_export`.
+    """
+    store = store or PartitionedStore(settings.CACHE_DIR)
+    meta = store.read_meta()
+    if meta is not None and meta.get("schema") != SCHEMA_VERSION:
+        meta = None
+
+    if meta is None and offline:
+        raise FileNotFoundError(f"Offline mode is enabled but there is no snapshot in {store.directory}")
+    if meta is not None and (offline or store.age() < ttl):
+        synced_at = meta.get("synced_at", meta["fetched_at"])
+        if not offline and api_url and time.time() - synced_at >= sync_interval:
+            try:
+                sync(store, api_url)
+                meta = store.read_meta()
+            except (requests.RequestException, ValueError):
+                logger.warning("Could not sync new records from %s", api_url, exc_info=True)
+        record_cache("snapshot", hit=True)
+        return Dataset.from_store(store, meta)
+
+    try:
+        stream, validators = fetch_export(url,
+                                          etag=meta and meta.get("etag"),
+                                          last_modified=meta and meta.get("last_modified"),
+                                          progress=progress)
+        if stream is not None:
+            # The download happens while the stream is ingested
+            with stream:
+                meta = ingest_export(stream, store, schema=SCHEMA_VERSION, source=url, **validators)
+    except (requests.RequestException, OSError):
+        if meta is None:
+            raise
+        logger.warning("Could not refresh %s, serving the local snapshot", url, exc_info=True)
+        return Dataset.from_store(store, meta)
+
+    if stream is None:
+        meta = store.touch()
+        record_cache("snapshot", hit=True)
+        return Dataset.from_store(store, meta)
+
+    record_cache("snapshot", hit=False)
+    memory = meta["memory"]
+    logger.info("Stored %d rows from %s (version %s): %.1f MB read with pd.read_csv defaults, %.1f MB with the "
+                "schema's columns and dtypes, %.1f MB after cleaning", meta["rows"], url, meta["version"],
+                memory["default_bytes"] / 1e6, memory["parsed_bytes"] / 1e6, memory["clean_bytes"] / 1e6)
+    return Dataset.from_store(store, meta)
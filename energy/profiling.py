@@ -0,0 +1,198 @@
+"""Opt-in timing of page reruns.
+
+Switched on with `?profile=1` in the URL or ENERGY_PROFILE=1. Each rerun
+records how long its named stages took, the size of every Plotly figure it
+sent and the hit/miss counts of the data caches, then shows them in a
+sidebar panel and appends them to a JSON lines log. The latest figures of
+every page are also written in the Prometheus text format.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from energy import settings
+
+logger = logging.getLogger(__name__)
+
+# Per process: calls and misses of every tracked cache
+_cache_counts = defaultdict(Counter)
+# Per process: the last rerun of every page, for the Prometheus export
+_last_runs = {}
+_lock = threading.Lock()
+
+
+def enabled():
+    if settings.PROFILE:
+        return True
+    if st.query_params.get("profile") in ("1", "true"):
+        # Remember it for the session, query parameters do not follow page switches
+        st.session_state["_profile"] = True
+    return st.session_state.get("_profile", False)
+
+
+def record_cache(name, hit):
+    with _lock:
+        _cache_counts[name]["calls"] += 1
+        if not hit:
+            _cache_counts[name]["misses"] += 1
+
+
+def tracked(name, cache):
+    """Wrap `func` in the Streamlit `cache` decorator, counting its hits and misses."""
+    def decorate(func):
+        missed = threading.local()
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            missed.value = True
+            return func(*args, **kwargs)
+
+        cached = cache(compute)
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            missed.value = False
+            result = cached(*args, **kwargs)
+            record_cache(name, hit=not missed.value)
+            return result
+
+        call.clear = cached.clear
+        return call
+    return decorate
+
+
+class Profiler:
+    def __init__(self, page):
+        self.page = page
+        self.enabled = enabled()
+        self.stages = []
+        self.figures = []
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, name):
+        """Record the time since the previous mark as stage `name`."""
+        now = time.perf_counter()
+        self.stages.append((name, now - self._last))
+        self._last = now
+
+    def plotly_chart(self, name, fig, **kwargs):
+        """Send `fig`, a Plotly figure or the JSON of one from `energy.figures`."""
+        # Streamlit serialises the figure inside st.plotly_chart, so that is what is timed
+        self.mark(f"{name} (build)")
+        if isinstance(fig, str):
+            from energy.figures import plotly_chart_json
+
+            result = plotly_chart_json(fig, **kwargs)
+        else:
+            result = st.plotly_chart(fig, **kwargs)
+        self.mark(f"{name} (send)")
+        if self.enabled:
+            size = len(fig) if isinstance(fig, str) else len(pio.to_json(fig, validate=False))
+            self.figures.append((name, size))
+        return result
+
+    def report(self):
+        with _lock:
+            caches = {name: dict(counts) for name, counts in _cache_counts.items()}
+        return {"page": self.page, "timestamp": time.time(),
+                "total_seconds": time.perf_counter() - self._start,
+                "stages": dict(self.stages), "figure_bytes": dict(self.figures), "caches": caches}
+
+    def finish(self, container=None):
+        """Show and save the report of this rerun, when profiling is on."""
+        if not self.enabled:
+            return
+        report = self.report()
+        with _lock:
+            _last_runs[self.page] = report
+        _write_report(report)
+        _render_panel(report, container or st.sidebar)
+
+
+def start(page):
+    profiler = Profiler(page)
+    st.session_state["_profiler"] = profiler
+    return profiler
+
+
+def current():
+    return st.session_state.get("_profiler") or start("unknown")
+
+
+def fragment(name):
+    """`st.fragment` whose own reruns are profiled as `<page> / <name>`.
+
+    During a full run the fragment body records into the page profiler, which
+    it reaches through `current()`.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            ctx = get_script_run_ctx()
+            if ctx is None or not ctx.fragment_ids_this_run:
+                return func(*args, **kwargs)
+            page = current()
+            profiler = start(f"{page.page} / {name}")
+            try:
+                return func(*args, **kwargs)
+            finally:
+                # Drawn inside the fragment: elements it sends elsewhere would pile up
+                profiler.finish(container=st)
+                st.session_state["_profiler"] = page
+        return st.fragment(run)
+    return decorate
+
+
+def to_prometheus():
+    with _lock:
+        runs = list(_last_runs.values())
+        caches = {name: dict(counts) for name, counts in _cache_counts.items()}
+
+    lines = ["# TYPE energy_rerun_seconds gauge"]
+    for run in runs:
+        lines.append(f'energy_rerun_seconds{{page="{run["page"]}"}} {run["total_seconds"]:.6f}')
+    lines.append("# TYPE energy_stage_seconds gauge")
+    for run in runs:
+        for stage, seconds in run["stages"].items():
+            lines.append(f'energy_stage_seconds{{page="{run["page"]}",stage="{stage}"}} {seconds:.6f}')
+    lines.append("# TYPE energy_figure_bytes gauge")
+    for run in runs:
+        for figure, size in run["figure_bytes"].items():
+            lines.append(f'energy_figure_bytes{{page="{run["page"]}",figure="{figure}"}} {size}')
+    lines.append("# TYPE energy_cache_calls_total counter")
+    lines.append("# TYPE energy_cache_misses_total counter")
+    for name, counts in caches.items():
+        lines.append(f'energy_cache_calls_total{{cache="{name}"}} {counts.get("calls", 0)}')
+        lines.append(f'energy_cache_misses_total{{cache="{name}"}} {counts.get("misses", 0)}')
+    return "\n".join(lines) + "\n"
+
+
+def _write_report(report):
+    try:
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(settings.PROFILE_DIR, "reruns.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+        with open(os.path.join(settings.PROFILE_DIR, "metrics.prom"), "w", encoding="utf-8") as f:
+            f.write(to_prometheus())
+    except OSError:
+        logger.warning("Could not write the profile of %s", report["page"], exc_info=True)
+
+
+def _render_panel(report, container):
+    with container.expander(f"⏱️ Rerun profile: {report['total_seconds'] * 1000:.0f} ms", expanded=True):
+        st.table(pd.Series({name: seconds * 1000 for name, seconds in report["stages"].items()},
+                           name="ms").round(1))
+        if report["figure_bytes"]:
+            st.table(pd.Series({name: size / 1000 for name, size in report["figure_bytes"].items()},
+                               name="figure kB").round(1))
+        if report["caches"]:
+            st.table(pd.DataFrame.from_dict(report["caches"], orient="index").fillna(0).astype(int))
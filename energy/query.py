@@ -0,0 +1,74 @@
+"""Date-range queries over the whole history, run by DuckDB.
+
+DuckDB scans the memory-mapped Arrow tables of the years a query covers in
+place: the date range is pushed down into the scan and the aggregation runs
+on every core, so any window from 2012 to today comes back at interactive
+speed.
+"""
+import duckdb
+import pandas as pd
+import streamlit as st
+
+from energy import schema
+from energy.loader import Dataset
+
+# Resolution names shown on the pages, and the start of their buckets. Paris
+# is a whole number of hours from UTC, so sub-daily buckets can be cut on the
+# UTC timestamp; longer ones come from the local calendar keys of the
+# snapshot, much faster than time-zone aware bucketing
+RESOLUTIONS = {
+    'half-hour': "time_bucket(INTERVAL '30 minutes', date_heure)",
+    'hour': "time_bucket(INTERVAL '1 hour', date_heure)",
+    'day': "make_date(year, month, day)",
+    'week': "date_trunc('week', make_date(year, month, day))",
+    'month': "make_date(year, month, 1)",
+}
+AGGREGATIONS = {'mean': 'avg', 'sum': 'sum', 'min': 'min', 'max': 'max'}
+
+
+class QueryEngine:
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self._con = duckdb.connect()
+
+    def query(self, start, end, resolution='day', aggregation='mean', columns=schema.MEASURES):
+        """Aggregate `columns` over [start, end) into buckets of `resolution`.
+
+        Returns a frame indexed by the start of each bucket, in local time.
+        """
+        bucket = RESOLUTIONS[resolution]
+        function = AGGREGATIONS[aggregation]
+        # NaN is stored as a value, not a null: keep it out of the aggregates
+        selected = ", ".join(f"{function}(nullif({c}::DOUBLE, 'nan'::DOUBLE)) AS {c}" for c in columns)
+        sql = (f"SELECT {bucket} AS date_heure, {selected} "
+               "FROM consommation WHERE date_heure >= $start AND date_heure < $end GROUP BY 1 ORDER BY 1")
+
+        start, end = _timestamp(start), _timestamp(end)
+        # Only the partitions of the years in the range are mapped
+        table = self.dataset.read_table(years=range(start.year, end.year + 1),
+                                        columns=['date_heure', 'year', 'month', 'day', *columns])
+        if table is None:
+            return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], tz=schema.TIMEZONE, name='date_heure'))
+
+        # One cursor per query, so sessions can query concurrently
+        cursor = self._con.cursor()
+        try:
+            cursor.register("consommation", table)
+            result = cursor.execute(sql, {"start": start, "end": end}).df()
+        finally:
+            cursor.close()
+        index = pd.DatetimeIndex(result.pop('date_heure'))
+        index = index.tz_convert(schema.TIMEZONE) if index.tz else index.tz_localize(schema.TIMEZONE)
+        return result.set_axis(index.rename('date_heure'))
+
+
+def _timestamp(value):
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        value = value.tz_localize(schema.TIMEZONE)
+    return value.to_pydatetime()
+
+
+@st.cache_resource(show_spinner=False, hash_funcs={Dataset: lambda d: d.version}, max_entries=2)
+def get_engine(dataset):
+    return QueryEngine(dataset)
@@ -0,0 +1,67 @@
+"""Schema and cleaning rules for the raw ODRE export."""
+import hashlib
+
+import pandas as pd
+import pyarrow as pa
+
+# Bumped whenever `clean` changes shape, so older snapshots are rebuilt
+SCHEMA_VERSION = 3
+
+# Calendar keys are taken in French local time, like the `date` column of the export
+TIMEZONE = 'Europe/Paris'
+
+MEASURES = ['consommation_brute_gaz_grtgaz', 'consommation_brute_gaz_terega', 'consommation_brute_gaz_totale',
+            'consommation_brute_electricite_rte', 'consommation_brute_totale']
+STATUSES = ['statut_grtgaz', 'statut_terega', 'statut_rte']
+
+# Only these columns are read from the export; `date` and `heure` are derived
+# from `date_heure`, which becomes the index
+USECOLS = ['date_heure', *MEASURES, *STATUSES]
+DTYPES = {**{column: 'float32' for column in MEASURES}, **{column: 'category' for column in STATUSES}}
+
+# Options for pd.read_csv on the export
+READ_OPTIONS = {"delimiter": ';', "usecols": USECOLS, "dtype": DTYPES}
+
+# The same columns and types for the pyarrow CSV reader; dates stay text until `clean`
+ARROW_TYPES = {'date_heure': pa.string(),
+               **{column: pa.float32() for column in MEASURES},
+               **{column: pa.dictionary(pa.int32(), pa.string()) for column in STATUSES}}
+
+# The snapshot is stored as one file per year; regional datasets add `region`
+PARTITION_BY = ['year']
+
+
+def clean(df):
+    # Keep only rows with gas figures, in the compact dtypes of the schema
+    df = df[USECOLS].dropna(subset=['consommation_brute_gaz_grtgaz']).astype(DTYPES)
+
+    # Sorted local time index: date ranges are selected with binary searches
+    index = pd.DatetimeIndex(pd.to_datetime(df['date_heure'], utc=True)).tz_convert(TIMEZONE)
+    df = df.drop(columns='date_heure').set_axis(index.rename('date_heure'))
+
+    # Compact calendar keys so pages never go through the `.dt` accessors
+    df['year'] = index.year.astype('int16')
+    df['month'] = index.month.astype('int8')
+    df['day'] = index.day.astype('int8')
+    df['hour'] = index.hour.astype('int8')
+    # Stable, so that of two records with the same timestamp the later one stays last
+    return df.sort_index(kind='stable')
+
+
+def memory_footprint(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def calendar_meta(df):
+    """Years and months present in `df`, for the page selectors."""
+    return {"years": sorted(int(y) for y in df['year'].unique()),
+            "months": sorted(int(m) for m in df['month'].unique())}
+
+
+def frame_digest(df):
+    return hashlib.sha1(pd.util.hash_pandas_object(df).values.tobytes()).hexdigest()
+
+
+def frame_version(digests):
+    # Content hash of the partitions, so the version only changes when the data does
+    return hashlib.sha1("".join(digests).encode()).hexdigest()[:16]
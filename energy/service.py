@@ -0,0 +1,107 @@
+"""Loads the dataset off the script thread and shares it between sessions.
+
+The first page run of the server starts loading the dataset on a worker
+thread. Pages serve the last snapshot while a newer version is being
+fetched, and only wait, behind a progress bar, when there is no snapshot
+at all. Concurrent requests share the one load in flight.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import streamlit as st
+
+from energy import settings
+from energy.loader import load_dataset, read_snapshot
+from energy.profiling import record_cache
+from energy.store import PartitionedStore
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetService:
+    def __init__(self, url=settings.DATASET_URL, store=None, refresh_interval=settings.SYNC_INTERVAL):
+        self.url = url
+        self.store = store or PartitionedStore(settings.CACHE_DIR)
+        self.refresh_interval = refresh_interval
+        # Bytes downloaded so far and the total, when known
+        self.progress = (0, None)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="energy-loader")
+        self._lock = threading.Lock()
+        self._future = None
+        self._dataset = None
+        self._attempted_at = None
+
+    def refresh(self):
+        """Start loading the dataset unless a load is in flight; return its future."""
+        with self._lock:
+            if self._future is None or self._future.done():
+                self.progress = (0, None)
+                self._attempted_at = time.monotonic()
+                self._future = self._executor.submit(self._load)
+            return self._future
+
+    def current(self):
+        """The latest dataset, or None; starts a refresh in the background when one is due."""
+        with self._lock:
+            if self._dataset is None and self._attempted_at is None:
+                # Whatever the snapshot's age, it beats an empty page
+                try:
+                    self._dataset = read_snapshot(self.store)
+                except OSError:
+                    logger.warning("Could not read the snapshot in %s", self.store.directory, exc_info=True)
+            due = self._attempted_at is None or time.monotonic() - self._attempted_at >= self.refresh_interval
+            dataset = self._dataset
+        if due:
+            self.refresh()
+        return dataset
+
+    def _load(self):
+        try:
+            dataset = load_dataset(self.url, store=self.store, progress=self._on_progress)
+        except Exception:
+            logger.exception("Could not load %s", self.url)
+            raise
+        with self._lock:
+            self._dataset = dataset
+        return dataset
+
+    def _on_progress(self, read_bytes, total):
+        self.progress = (read_bytes, total)
+
+
+@st.cache_resource(show_spinner=False)
+def dataset_service(url=settings.DATASET_URL):
+    return DatasetService(url)
+
+
+def prefetch(url=settings.DATASET_URL):
+    """Start loading the dataset in the background, if it is not loaded yet."""
+    dataset_service(url).current()
+
+
+def load_data(url=settings.DATASET_URL):
+    """The dataset for a page run; waits, showing progress, only if there is no snapshot yet."""
+    service = dataset_service(url)
+    dataset = service.current()
+    record_cache("dataset", hit=dataset is not None)
+    if dataset is not None:
+        return dataset
+
+    placeholder = st.empty()
+    future = service.refresh()
+    try:
+        while True:
+            try:
+                return future.result(timeout=0.2)
+            except FutureTimeout:
+                read_bytes, total = service.progress
+                if total and read_bytes >= total:
+                    placeholder.progress(1.0, text="Preparing consumption data...")
+                else:
+                    placeholder.progress(min(read_bytes / total, 1.0) if total else 0.0,
+                                         text=f"Downloading consumption data: {read_bytes / 1e6:.1f} MB")
+    finally:
+        placeholder.empty()
@@ -0,0 +1,50 @@
+"""Runtime settings for the energy data layer, read from the environment.
+
+ENERGY_DATASET_URL    CSV export of the ODRE dataset (URL or local path)
+ENERGY_API_URL        records API of the same dataset, used for incremental syncs
+ENERGY_CACHE_DIR      directory holding the local snapshot
+ENERGY_CACHE_TTL      seconds before the full export is checked against the server
+ENERGY_SYNC_INTERVAL  seconds between incremental syncs of new records
+ENERGY_OFFLINE        set to 1 to only ever serve the local snapshot
+ENERGY_CHART_WIDTH    width in pixels used to size downsampled line charts
+ENERGY_PROFILE        set to 1 to profile every rerun (or add ?profile=1 to the URL)
+ENERGY_PROFILE_DIR    directory receiving the rerun profiles
+ENERGY_FIGURE_CACHE   megabytes of serialised figures kept in memory, per process
+ENERGY_INGEST_MEMORY  memory ceiling in megabytes for ingesting a full export
+ENERGY_INGEST_WORKERS processes cleaning blocks of the export (0: in the server process),
+                      fewer if ENERGY_INGEST_MEMORY cannot hold them
+"""
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DATASET_URL = os.environ.get(
+    "ENERGY_DATASET_URL",
+    "https://odre.opendatasoft.com/api/explore/v2.1/catalog/datasets/consommation-quotidienne-brute/exports/csv")
+
+API_URL = os.environ.get(
+    "ENERGY_API_URL",
+    "https://odre.opendatasoft.com/api/explore/v2.1/catalog/datasets/consommation-quotidienne-brute/records")
+
+CACHE_DIR = os.environ.get("ENERGY_CACHE_DIR", os.path.join(ROOT_DIR, ".cache", "energy"))
+
+CACHE_TTL = float(os.environ.get("ENERGY_CACHE_TTL", 24 * 3600))
+
+SYNC_INTERVAL = float(os.environ.get("ENERGY_SYNC_INTERVAL", 5 * 60))
+
+OFFLINE = os.environ.get("ENERGY_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+CHART_WIDTH = int(os.environ.get("ENERGY_CHART_WIDTH", 1200))
+
+PROFILE = os.environ.get("ENERGY_PROFILE", "0").lower() in ("1", "true", "yes")
+
+PROFILE_DIR = os.environ.get("ENERGY_PROFILE_DIR", os.path.join(ROOT_DIR, ".cache", "profile"))
+
+FIGURE_CACHE_MB = float(os.environ.get("ENERGY_FIGURE_CACHE", 128))
+
+INGEST_MEMORY_MB = float(os.environ.get("ENERGY_INGEST_MEMORY", 512))
+
+INGEST_WORKERS = int(os.environ.get("ENERGY_INGEST_WORKERS", min(os.cpu_count() or 1, 8)))
+
+# Timeout (connect, read) in seconds for requests to the ODRE servers
+HTTP_TIMEOUT = (10, 120)
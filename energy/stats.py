@@ -0,0 +1,54 @@
+"""Box-plot statistics computed on the server.
+
+`px.box` ships every value to the browser so plotly.js can compute the
+quartiles there. These helpers compute them once per data version and draw
+the boxes from the precomputed numbers, with a capped sample of outliers.
+"""
+import numpy as np
+import plotly.graph_objects as go
+import streamlit as st
+
+from energy.loader import Dataset
+from energy.profiling import tracked
+
+# Most outliers drawn per box; the most extreme ones are always kept
+MAX_OUTLIERS = 300
+
+
+def box_stats(values, max_outliers=MAX_OUTLIERS, seed=0):
+    """Quartiles, whiskers and outliers of `values`, like plotly.js computes them."""
+    values = np.asarray(values, dtype=float)
+    values = np.sort(values[~np.isnan(values)])
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+
+    # Whiskers end on the furthest data points within 1.5 IQR of the box
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    lowerfence, upperfence = inside[0], inside[-1]
+
+    outliers = values[(values < lowerfence) | (values > upperfence)]
+    if len(outliers) > max_outliers:
+        rng = np.random.default_rng(seed)
+        middle = rng.choice(outliers[1:-1], size=max_outliers - 2, replace=False)
+        outliers = np.concatenate([outliers[:1], np.sort(middle), outliers[-1:]])
+
+    return {"q1": q1, "median": median, "q3": q3, "lowerfence": lowerfence, "upperfence": upperfence,
+            "mean": values.mean(), "count": len(values), "outliers": outliers}
+
+
+def box_figure(stats, title=None):
+    fig = go.Figure()
+    for name, s in stats.items():
+        fig.add_trace(go.Box(x=[name], name=name, q1=[s["q1"]], median=[s["median"]], q3=[s["q3"]],
+                             lowerfence=[s["lowerfence"]], upperfence=[s["upperfence"]], mean=[s["mean"]],
+                             marker_color='#636efa', showlegend=False))
+        fig.add_trace(go.Scatter(x=[name] * len(s["outliers"]), y=s["outliers"], mode='markers', name=name,
+                                 marker=dict(color='#636efa', size=4), showlegend=False))
+    fig.update_layout(title=title, xaxis_title='variable', yaxis_title='value')
+    return fig
+
+
+# One entry per version: the current and previous ones are kept, like the cubes
+@tracked("box_stats", st.cache_data(show_spinner=False, hash_funcs={Dataset: lambda d: d.version}, max_entries=2))
+def get_box_stats(dataset, columns):
+    return {column: box_stats(dataset.column(column)) for column in columns}
@@ -0,0 +1,213 @@
+"""On-disk snapshots of the cleaned dataset.
+
+Frames are written as uncompressed Feather (Arrow IPC) files so they can be
+memory-mapped back in, next to a small JSON file with their metadata.
+"""
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from energy.schema import DTYPES, PARTITION_BY, frame_digest, frame_version
+
+
+# Seconds a version is kept after it was committed, even once it is neither
+# the current nor the previous one: another server sharing the directory may
+# have read its metadata and be about to map it
+VERSION_GRACE = 3600
+# Seconds after which a staging directory left by a killed ingestion is removed
+STAGING_TTL = 24 * 3600
+
+
+def frame_table(df):
+    table = pa.Table.from_pandas(df)
+    # Keep NaN as a float value instead of a null, so the column stays zero-copy on read
+    for i, name in enumerate(table.column_names):
+        if name in df.columns and df[name].dtype.kind == 'f':
+            table = table.set_column(i, name, pa.array(df[name].to_numpy(), from_pandas=False))
+    return table
+
+
+def write_frame(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # One record batch: Feather splits tables into batches of 64K rows by
+    # default, and a column in several chunks is copied on read
+    feather.write_feather(frame_table(df), path, compression="uncompressed", chunksize=max(len(df), 1))
+
+
+def tables_to_frame(tables):
+    """One sorted frame from the mapped tables of several partitions."""
+    if len(tables) == 1:
+        # A single partition is already sorted and stays zero-copy
+        return _to_pandas(tables[0])
+    frames = [_to_pandas(table) for table in tables]
+    return pd.concat(frames).sort_index().astype({c: t for c, t in DTYPES.items() if c in frames[0].columns})
+
+
+class _MetaStore:
+    """Metadata file of a snapshot, shared by both layouts."""
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.meta_path = os.path.join(directory, f"{name}.json")
+
+    def exists(self):
+        return os.path.exists(self.meta_path)
+
+    def read_meta(self):
+        if not self.exists():
+            return None
+        with open(self.meta_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_meta(self, meta):
+        self._atomic_write(self.meta_path, lambda path: _dump_json(meta, path))
+
+    def age(self):
+        meta = self.read_meta()
+        if meta is None:
+            return float("inf")
+        return time.time() - meta.get("fetched_at", 0)
+
+    def touch(self):
+        # The server confirmed our copy is current: restart the TTL
+        meta = self.read_meta()
+        meta["fetched_at"] = time.time()
+        self.write_meta(meta)
+        return meta
+
+    def _atomic_write(self, path, writer):
+        # Write next to the target then rename, so readers never see a partial file
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+
+
+class SnapshotStore(_MetaStore):
+    """Snapshot of one frame in a single file, such as the aggregate cube."""
+
+    def __init__(self, directory, name="consommation"):
+        super().__init__(directory, name)
+        self.data_path = os.path.join(directory, f"{name}.feather")
+
+    def exists(self):
+        return os.path.exists(self.data_path) and super().exists()
+
+    def read_table(self):
+        return feather.read_table(self.data_path, memory_map=True)
+
+    def read(self):
+        return _to_pandas(self.read_table())
+
+    def write(self, df, **meta):
+        self._atomic_write(self.data_path, lambda path: write_frame(df, path))
+        meta = {"fetched_at": time.time(), **meta, "rows": len(df)}
+        self.write_meta(meta)
+        return meta
+
+
+class PartitionedStore(_MetaStore):
+    """Snapshot split into one file per partition, by year (and region).
+
+    Every version is written once into its own directory and never changed,
+    so sessions still mapping an older version are not affected by a sync.
+    Partitions a new version leaves alone are hard links to the old files.
+    """
+
+    def __init__(self, directory, name="consommation", partition_by=PARTITION_BY):
+        super().__init__(directory, name)
+        self.partition_by = list(partition_by)
+        self.root = os.path.join(directory, name)
+
+    def partition_path(self, directory, key):
+        parts = [f"{name}={value}" for name, value in zip(self.partition_by, key)]
+        return os.path.join(directory, *parts, "data.feather")
+
+    def map_partitions(self, version, keys, columns=None):
+        """{key: memory-mapped table} for the partitions `keys` of `version`.
+
+        A mapping outlives the removal of its file, so tables mapped here stay
+        readable after the version is pruned.
+        """
+        directory = os.path.join(self.root, version)
+        return {key: feather.read_table(self.partition_path(directory, key), columns=columns, memory_map=True)
+                for key in keys}
+
+    def read(self, version, keys, columns=None):
+        """The partitions `keys` of `version` as one sorted frame."""
+        return tables_to_frame(list(self.map_partitions(version, keys, columns).values()))
+
+    def stage(self):
+        """A new empty directory to write the partitions of a version into."""
+        os.makedirs(self.root, exist_ok=True)
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".staging-") and time.time() - os.path.getmtime(path) > STAGING_TTL:
+                shutil.rmtree(path, ignore_errors=True)
+        staging = os.path.join(self.root, f".staging-{os.getpid()}-{time.time_ns()}")
+        os.makedirs(staging)
+        return staging
+
+    def write_partitions(self, frames, base=None, **meta):
+        """Write a version made of `frames`, {key: frame}, and the other partitions of `base`."""
+        staging = self.stage()
+        try:
+            entries = [{"key": list(key), "digest": frame_digest(df), "rows": len(df)} for key, df in frames.items()]
+            for key, df in frames.items():
+                write_frame(df, self.partition_path(staging, key))
+            if base is not None:
+                base_dir = os.path.join(self.root, base["version"])
+                for entry in base["partitions"]:
+                    key = tuple(entry["key"])
+                    if key not in frames:
+                        target = self.partition_path(staging, key)
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        os.link(self.partition_path(base_dir, key), target)
+                        entries.append(entry)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return self.commit(staging, entries, **meta)
+
+    def commit(self, staging, entries, **meta):
+        """Publish the partitions written to `staging` as a new version; return its metadata."""
+        previous = self.read_meta()
+        entries = sorted(entries, key=lambda entry: entry["key"])
+        version = frame_version(entry["digest"] for entry in entries)
+        target = os.path.join(self.root, version)
+        if os.path.exists(target):
+            # Same content as a version already on disk
+            shutil.rmtree(staging, ignore_errors=True)
+        else:
+            os.replace(staging, target)
+        # The grace period before pruning runs from the last commit
+        os.utime(target)
+        meta = {"fetched_at": time.time(), **meta, "version": version, "partitions": entries,
+                "rows": sum(entry["rows"] for entry in entries)}
+        self.write_meta(meta)
+        self._prune(keep={version, previous and previous["version"]})
+        return meta
+
+    def _prune(self, keep):
+        # Datasets map their partitions when they are created, so removing a
+        # version only affects servers that have not mapped it yet
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name not in keep and not name.startswith(".") and time.time() - os.path.getmtime(path) > VERSION_GRACE:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _to_pandas(table):
+    # Numeric columns without nulls are wrapped around the mapped file, not copied
+    return table.to_pandas(split_blocks=True)
+
+
+def _dump_json(obj, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2)
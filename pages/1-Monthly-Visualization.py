@@ -3,21 +3,35 @@ import pandas as pd
 import plotly.express as px
 import calendar
 
-@st.cache_data  
-def load_data(url):
-    df = pd.read_csv(url, delimiter=';')
-    # Convert the 'Date/Time' column to datetime format
-    df = df.dropna(subset=['consommation_brute_gaz_grtgaz'])
-    df = df.reset_index(drop=True)
-    
-    df['date'] = pd.to_datetime(df['date'])
-    df['date_heure'] = pd.to_datetime(df['date_heure'])
-    df['heure'] = pd.to_datetime(df['heure'], format='%H:%M').dt.hour
-    return df
-
-
-df = load_data(
-    "https://odre.opendatasoft.com/api/explore/v2.1/catalog/datasets/consommation-quotidienne-brute/exports/csv")
+from energy import profiling
+from energy.cube import get_rollup
+from energy.downsample import downsample
+from energy.figures import cached_figure
+from energy.query import AGGREGATIONS, RESOLUTIONS, get_engine
+from energy.schema import MEASURES
+from energy.service import load_data
+from energy.stats import box_figure, get_box_stats
+
+profiler = profiling.start("Monthly")
+
+data = load_data()
+profiler.mark("load data")
+
+# Selector options come from the dataset metadata rather than scanning the frame
+month_options = [calendar.month_name[m] for m in data.months]
+month_numbers = {calendar.month_name[m]: m for m in data.months}
+
+
+def zoom_window(frame, key):
+    # Narrowing the window re-slices the time index, down to full resolution
+    if frame.empty or frame.index[0].date() == frame.index[-1].date():
+        return frame
+    first, last = frame.index[0].date(), frame.index[-1].date()
+    start, end = st.slider('Zoom on a date range', min_value=first, max_value=last, value=(first, last), key=key)
+    bounds = [pd.Timestamp(start), pd.Timestamp(end) + pd.Timedelta(days=1)]
+    lo, hi = frame.index.searchsorted([b.tz_localize(frame.index.tz) for b in bounds])
+    return frame.iloc[lo:hi]
+
 
 st.write("""
 # Energy Consumption Analysis
@@ -34,47 +48,55 @@ This chart compares the gas consumption between GRTgaz and Teréga for the selec
 By visualizing the consumption trends, we can understand how gas usage varies between these two suppliers.
 """)
 
-# Create three columns for the selections
-col1, col2, col3 = st.columns(3)
 
-# Column 1: Select year for the first chart (default is 2023)
-with col1:
-    year1 = st.selectbox('Select a year for GRTgaz vs Teréga comparison', 
-                         options=df['date'].dt.year.unique(), index=0)
+# Charts 1 and 2 are fragments: their widgets only rerun their own section
+@profiling.fragment("chart 1")
+def gas_suppliers_chart():
+    profiler = profiling.current()
+
+    # Create three columns for the selections
+    col1, col2, col3 = st.columns(3)
 
-# Column 2: Select month for the first chart (or 'All' for the entire year)
-with col2:
-    month1 = st.selectbox('Select a month for GRTgaz vs Teréga comparison', 
-                          options=['All'] + list(df['date'].dt.month_name().unique()), index=0)
+    # Column 1: Select year for the first chart (default is 2023)
+    with col1:
+        year1 = st.selectbox('Select a year for GRTgaz vs Teréga comparison', 
+                             options=data.years, index=0)
 
-# Column 3: Checkboxes for variables to display for the first chart
-with col3:
-    show_gaz_grtgaz = st.checkbox('Show GRTgaz Consumption', value=True)
-    show_gaz_terega = st.checkbox('Show Teréga Consumption', value=True)
+    # Column 2: Select month for the first chart (or 'All' for the entire year)
+    with col2:
+        month1 = st.selectbox('Select a month for GRTgaz vs Teréga comparison', 
+                              options=['All'] + month_options, index=0)
 
-# Filter data based on the selected year and month
-filtered_df1 = df[df['date'].dt.year == year1]
+    # Column 3: Checkboxes for variables to display for the first chart
+    with col3:
+        show_gaz_grtgaz = st.checkbox('Show GRTgaz Consumption', value=True)
+        show_gaz_terega = st.checkbox('Show Teréga Consumption', value=True)
 
-# If the user selects a specific month, filter by that month
-if month1 != 'All':
-    filtered_df1 = filtered_df1[filtered_df1['date'].dt.month_name() == month1]
+    # Slice the selected year, or only the selected month of it, from the sorted time index
+    filtered_df1 = data.period(year1, None if month1 == 'All' else month_numbers[month1])
+    profiler.mark("chart 1 filter")
 
-# Prepare the list of variables to display based on checkboxes
-variables1 = []
-if show_gaz_grtgaz:
-    variables1.append('consommation_brute_gaz_grtgaz')
-if show_gaz_terega:
-    variables1.append('consommation_brute_gaz_terega')
+    # Prepare the list of variables to display based on checkboxes
+    variables1 = []
+    if show_gaz_grtgaz:
+        variables1.append('consommation_brute_gaz_grtgaz')
+    if show_gaz_terega:
+        variables1.append('consommation_brute_gaz_terega')
 
+    # Chart 1: GRTgaz vs Teréga gas consumption comparison
+    if variables1:
+        # Only the peaks of each pixel-wide bucket are sent to the browser
+        window1 = zoom_window(filtered_df1, key='zoom1')
+        # Served from the figure cache when this selection was already drawn
+        fig1 = cached_figure("chart 1", (year1, month1, *variables1, window1.index.min(), window1.index.max()), data,
+                             lambda: px.line(downsample(window1, variables1), x='date', y='value', color='variable',
+                                             title=f"Gas Consumption Comparison: GRTgaz vs Teréga in {year1} ({month1 if month1 != 'All' else 'All Year'})"))
+        profiler.plotly_chart("chart 1", fig1)
+    else:
+        st.write("Please select at least one variable for the GRTgaz vs Teréga chart.")
 
 
-# Chart 1: GRTgaz vs Teréga gas consumption comparison
-if variables1:
-    fig1 = px.line(filtered_df1, x='date', y=variables1, 
-                   title=f"Gas Consumption Comparison: GRTgaz vs Teréga in {year1} ({month1 if month1 != 'All' else 'All Year'})")
-    st.plotly_chart(fig1)
-else:
-    st.write("Please select at least one variable for the GRTgaz vs Teréga chart.")
+gas_suppliers_chart()
 
 # Placeholder for results interpretation
 st.write("### Results Interpretation:")
@@ -88,47 +110,53 @@ st.write("""
 ### Chart 2: Gas vs Electricity Consumption Comparison
 This chart compares the total gas consumption to electricity consumption for the selected year and month.
 """)
-# Create another three columns for the second chart selections
-col4, col5, col6 = st.columns(3)
 
-# Column 1: Select year for the second chart (default is 2023)
-with col4:
-    year2 = st.selectbox('Select a year for Gas vs Electricity comparison', 
-                         options=df['date'].dt.year.unique(), index=0)
 
-# Column 2: Select month for the second chart (or 'All' for the entire year)
-with col5:
-    month2 = st.selectbox('Select a month for Gas vs Electricity comparison', 
-                          options=['All'] + list(df['date'].dt.month_name().unique()), index=0)
+@profiling.fragment("chart 2")
+def gas_vs_electricity_chart():
+    profiler = profiling.current()
 
-# Column 3: Checkboxes for variables to display for the second chart
-with col6:
-    show_gaz_totale = st.checkbox('Show Total Gas Consumption', value=True)
-    show_electricite = st.checkbox('Show Electricity Consumption', value=True)
+    # Create another three columns for the second chart selections
+    col4, col5, col6 = st.columns(3)
 
-# Filter data based on the selected year and month
-filtered_df2 = df[df['date'].dt.year == year2]
+    # Column 1: Select year for the second chart (default is 2023)
+    with col4:
+        year2 = st.selectbox('Select a year for Gas vs Electricity comparison', 
+                             options=data.years, index=0)
 
-# If the user selects a specific month, filter by that month
-if month2 != 'All':
-    filtered_df2 = filtered_df2[filtered_df2['date'].dt.month_name() == month2]
+    # Column 2: Select month for the second chart (or 'All' for the entire year)
+    with col5:
+        month2 = st.selectbox('Select a month for Gas vs Electricity comparison', 
+                              options=['All'] + month_options, index=0)
 
-# Prepare the list of variables to display based on checkboxes
-variables2 = []
-if show_gaz_totale:
-    variables2.append('consommation_brute_gaz_totale')
-if show_electricite:
-    variables2.append('consommation_brute_electricite_rte')
+    # Column 3: Checkboxes for variables to display for the second chart
+    with col6:
+        show_gaz_totale = st.checkbox('Show Total Gas Consumption', value=True)
+        show_electricite = st.checkbox('Show Electricity Consumption', value=True)
 
+    # Slice the selected year, or only the selected month of it, from the sorted time index
+    filtered_df2 = data.period(year2, None if month2 == 'All' else month_numbers[month2])
+    profiler.mark("chart 2 filter")
 
+    # Prepare the list of variables to display based on checkboxes
+    variables2 = []
+    if show_gaz_totale:
+        variables2.append('consommation_brute_gaz_totale')
+    if show_electricite:
+        variables2.append('consommation_brute_electricite_rte')
 
-# Chart 2: Gas vs Electricity consumption comparison
-if variables2:
-    fig4 = px.line(filtered_df2, x='date', y=variables2, 
-                   title=f"Gas vs Electricity Consumption in {year2} ({month2 if month2 != 'All' else 'All Year'})")
-    st.plotly_chart(fig4)
-else:
-    st.write("Please select at least one variable for the Gas vs Electricity chart.")
+    # Chart 2: Gas vs Electricity consumption comparison
+    if variables2:
+        window2 = zoom_window(filtered_df2, key='zoom2')
+        fig4 = cached_figure("chart 2", (year2, month2, *variables2, window2.index.min(), window2.index.max()), data,
+                             lambda: px.line(downsample(window2, variables2), x='date', y='value', color='variable',
+                                             title=f"Gas vs Electricity Consumption in {year2} ({month2 if month2 != 'All' else 'All Year'})"))
+        profiler.plotly_chart("chart 2", fig4)
+    else:
+        st.write("Please select at least one variable for the Gas vs Electricity chart.")
+
+
+gas_vs_electricity_chart()
 
 st.write("### Results Interpretation:")
 st.write("""
@@ -139,8 +167,60 @@ Both gas and electricity consumption fluctuate throughout the year. There are pe
 The months of January and February show the highest consumption of both gas and electricity. Consumption tends to decrease in the spring and summer months, before increasing again in the autumn and winter.
 """)
 
+st.write("""
+### Explore Any Period
+Pick any date range of the history, a time resolution and an aggregation to compare the consumption series 
+beyond a single year or month.
+""")
+
+
+@profiling.fragment("explorer")
+def period_explorer_chart():
+    profiler = profiling.current()
+    first, last = (timestamp.date() for timestamp in data.span)
+
+    col7, col8, col9 = st.columns(3)
+
+    # Column 1: Date range, the last year by default
+    with col7:
+        period = st.date_input('Select a date range', value=(max(first, last - pd.Timedelta(days=365)), last),
+                               min_value=first, max_value=last)
+
+    # Column 2: Width of the time buckets (default is one day)
+    with col8:
+        resolution = st.selectbox('Select a resolution', options=list(RESOLUTIONS), index=2)
+
+    # Column 3: How the values of a bucket are combined
+    with col9:
+        aggregation = st.selectbox('Select an aggregation', options=list(AGGREGATIONS), index=0)
+
+    variables3 = st.multiselect('Select variables', options=MEASURES,
+                                default=['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte'])
+
+    # The picker returns a single date until the end of the range is picked
+    if len(period) < 2:
+        st.write("Please select the end of the date range.")
+    elif not variables3:
+        st.write("Please select at least one variable for the period chart.")
+    else:
+        start, end = pd.Timestamp(period[0]), pd.Timestamp(period[1]) + pd.Timedelta(days=1)
+
+        def period_figure():
+            # DuckDB aggregates the range, then long results are thinned to the chart width. The
+            # figure cache is keyed by every argument of the query: its result is never kept
+            result = get_engine(data).query(start, end, resolution, aggregation, variables3)
+            return px.line(downsample(result, variables3), x='date', y='value', color='variable',
+                           title=f"{aggregation.capitalize()} consumption per {resolution}, {period[0]} to {period[1]}")
+
+        fig_period = cached_figure("period explorer", (start, end, resolution, aggregation, *variables3), data,
+                                   period_figure)
+        profiler.plotly_chart("period explorer", fig_period)
+
+
+period_explorer_chart()
+
 # Monthly average consumption chart
-monthly_avg = df.groupby(df['date'].dt.month)[['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte']].mean().reset_index()
+monthly_avg = get_rollup(data, 'month', 'mean')[['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte']].rename_axis('date').reset_index()
 monthly_avg['date'] = monthly_avg['date'].apply(lambda x: calendar.month_name[x])
 
 st.write("""
@@ -149,9 +229,10 @@ This bar chart illustrates the monthly average consumption of gas and electricit
 of energy usage throughout the year.
 """)
 
-fig_avg = px.bar(monthly_avg, x='date', y=['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte'],
-                 title='Monthly Average Consumption of Gas and Electricity')
-st.plotly_chart(fig_avg)
+fig_avg = cached_figure("monthly average", (), data,
+                        lambda: px.bar(monthly_avg, x='date', y=['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte'],
+                                       title='Monthly Average Consumption of Gas and Electricity'))
+profiler.plotly_chart("monthly average", fig_avg)
 
 st.write("### Results Interpretation:")
 st.write("""
@@ -169,9 +250,11 @@ st.write("""
 The box plot provides a visual summary of the distribution of gas and electricity consumption. 
 It highlights the median, quartiles, and potential outliers in the data.""")
 
-fig_box = px.box(df, y=['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte'],
-                 title='Box Plot of Gas and Electricity Consumption')
-st.plotly_chart(fig_box)
+# Quartiles and whiskers are computed once per data version, not in the browser
+fig_box = cached_figure("box plot", (), data,
+                        lambda: box_figure(get_box_stats(data, ('consommation_brute_gaz_totale', 'consommation_brute_electricite_rte')),
+                                           title='Box Plot of Gas and Electricity Consumption'))
+profiler.plotly_chart("box plot", fig_box)
 
 st.write("""### Interpretation of Results: 
 The median gas consumption is notably higher, indicating that a majority of households consume more gas than electricity. The outliers suggest a few households consume significantly more gas than the general population.
@@ -183,9 +266,10 @@ st.write("""
 ### Proportion of Gas and Electricity Consumption
 This pie chart gives an overview of the total proportion of gas versus electricity consumption. """)
 
-total_consumption = df[['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte']].sum()
-fig_pie = px.pie(values=total_consumption, names=total_consumption.index, title='Proportion of Gas and Electricity Consumption')
-st.plotly_chart(fig_pie)
+total_consumption = get_rollup(data, 'year')[['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte']].sum()
+fig_pie = cached_figure("proportion pie", (), data,
+                        lambda: px.pie(values=total_consumption, names=total_consumption.index, title='Proportion of Gas and Electricity Consumption'))
+profiler.plotly_chart("proportion pie", fig_pie)
 
 st.write("""### Interpretation of Results:
 Throught the all the years, the proportion of gas and electricity are equal.
@@ -196,11 +280,12 @@ st.write("""
 The line chart below highlights the trends in energy consumption over the years. You can easily observe how gas and electricity consumption have evolved over the years.
 """)
 # Annual Trends for Gas and Electricity
-annual_trends = df.groupby(df['date'].dt.year)[['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte']].sum().reset_index()
+annual_trends = get_rollup(data, 'year')[['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte']].rename_axis('date').reset_index()
 
-fig_annual_trends = px.line(annual_trends, x='date', y=['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte'], 
-                             title='Annual Gas and Electricity Consumption Trends')
-st.plotly_chart(fig_annual_trends)
+fig_annual_trends = cached_figure("annual trends", (), data,
+                                  lambda: px.line(annual_trends, x='date', y=['consommation_brute_gaz_totale', 'consommation_brute_electricite_rte'], 
+                                                  title='Annual Gas and Electricity Consumption Trends'))
+profiler.plotly_chart("annual trends", fig_annual_trends)
 
 st.write("""### Interpretation of Results:
 The chart shows a notable decline in both gas and electricity consumption starting around 2020, which aligns with the onset of the COVID-19 pandemic. During this period, lockdowns and reduced industrial activity would have contributed to lower energy demand, especially in sectors like manufacturing, transportation, and commercial real estate. Many businesses closed or operated at reduced capacity, and fewer people commuted, which likely drove down both gas and electricity usage.
@@ -208,8 +293,6 @@ The chart shows a notable decline in both gas and electricity consumption starti
 In addition to the pandemic, post-2020 efforts toward greener energy sources and greater efficiency could also contribute to the continued decline in fossil fuel consumption like gas, along with better optimization of electricity use.
 """)
 
-df['date'] = pd.to_datetime(df['date'])
-
 st.write("""
 ### Monthly Electricity Consumption Breakdown
 This section provides a monthly breakdown of gas and electricity consumption. It is split into two pie charts to help visualize how energy usage varies across different months of the year.
@@ -220,12 +303,15 @@ This section provides a monthly breakdown of gas and electricity consumption. It
 month_names = pd.Series(pd.date_range('2021-01-01', periods=12, freq='M')).dt.month_name()
 
 # Monthly Consumption Breakdown for Gas
-monthly_gas_consumption = df.groupby(df['date'].dt.month)['consommation_brute_gaz_totale'].sum()
-fig_pie_gas = px.pie(values=monthly_gas_consumption, names=month_names[monthly_gas_consumption.index - 1], title='Monthly Gas Consumption Breakdown')
-st.plotly_chart(fig_pie_gas)
+monthly_gas_consumption = get_rollup(data, 'month')['consommation_brute_gaz_totale']
+fig_pie_gas = cached_figure("monthly gas pie", (), data,
+                            lambda: px.pie(values=monthly_gas_consumption, names=month_names[monthly_gas_consumption.index - 1], title='Monthly Gas Consumption Breakdown'))
+profiler.plotly_chart("monthly gas pie", fig_pie_gas)
 
 # Monthly Consumption Breakdown for Electricity
-monthly_electricity_consumption = df.groupby(df['date'].dt.month)['consommation_brute_electricite_rte'].sum()
-fig_pie_electricity = px.pie(values=monthly_electricity_consumption, names=month_names[monthly_electricity_consumption.index - 1], title='Monthly Electricity Consumption Breakdown')
-st.plotly_chart(fig_pie_electricity)
+monthly_electricity_consumption = get_rollup(data, 'month')['consommation_brute_electricite_rte']
+fig_pie_electricity = cached_figure("monthly electricity pie", (), data,
+                                    lambda: px.pie(values=monthly_electricity_consumption, names=month_names[monthly_electricity_consumption.index - 1], title='Monthly Electricity Consumption Breakdown'))
+profiler.plotly_chart("monthly electricity pie", fig_pie_electricity)
 
+profiler.finish()
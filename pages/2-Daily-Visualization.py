@@ -1,23 +1,21 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import calendar
 
-@st.cache_data  
-def load_data(url):
-    df = pd.read_csv(url, delimiter=';')
-    # Convert the 'Date/Time' column to datetime format
-    df = df.dropna(subset=['consommation_brute_gaz_grtgaz'])
-    df = df.reset_index(drop=True)
-    
-    df['date'] = pd.to_datetime(df['date'])
-    df['date_heure'] = pd.to_datetime(df['date_heure'])
-    df['heure'] = pd.to_datetime(df['heure'], format='%H:%M').dt.hour
-    return df
+from energy import profiling
+from energy.cube import get_profiles
+from energy.figures import cached_figure
+from energy.service import load_data
 
+profiler = profiling.start("Daily")
 
-df = load_data(
-    "https://odre.opendatasoft.com/api/explore/v2.1/catalog/datasets/consommation-quotidienne-brute/exports/csv")
+data = load_data()
+profiler.mark("load data")
+
+
+def month_profile(profile, month, column):
+    # One month's row of an all-months pivot, without the days that month lacks
+    return profile.loc[month, column].dropna().rename(column)
 
 
 st.write("""# Daily Energy Consumption Analysis: Gas vs Electricity Trends
@@ -34,37 +32,49 @@ This chart shows the hourly consumption of gas and electricity. It's interesting
          
 For electricity, there is less variation overall, but we notice a significant drop between 1 a.m. and 6 a.m.
 """)
-# Line chart section for hourly gas and electricity consumption
-selected_month_for_hourly = st.selectbox("Select a month for Hourly Consumption Chart:", months)
-selected_month_index = months.index(selected_month_for_hourly) + 1  # Get month number (1 for Jan, etc.)
-
-# Filter data for the selected month
-month_data = df[df['date'].dt.month == selected_month_index]
-
-if month_data.empty:
-    st.write(f"No data available for {selected_month_for_hourly}.")
-else:
-    # Group by the 'heure' (which is already converted to hour integer)
-    hourly_gas_data = month_data.groupby('heure')['consommation_brute_gaz_totale'].sum()
-    hourly_electricity_data = month_data.groupby('heure')['consommation_brute_electricite_rte'].sum()
-
-    # Plot gas consumption per hour
-    if not hourly_gas_data.empty:
-        fig_hourly_gas = px.bar(hourly_gas_data, 
-                                labels={'x': "Hour of Day", 'y': "Total Gas Consumption (MWh)"},
-                                title=f"Hourly Gas Consumption for {selected_month_for_hourly}")
-        st.plotly_chart(fig_hourly_gas)
-    else:
-        st.write(f"No gas data available for {selected_month_for_hourly}.")
-
-    # Plot electricity consumption per hour
-    if not hourly_electricity_data.empty:
-        fig_hourly_electricity = px.bar(hourly_electricity_data, 
-                                        labels={'x': "Hour of Day", 'y': "Total Electricity Consumption (MWh)"},
-                                        title=f"Hourly Electricity Consumption for {selected_month_for_hourly}")
-        st.plotly_chart(fig_hourly_electricity)
+
+
+# Each chart is a fragment: changing its month only reruns that chart
+@profiling.fragment("hourly")
+def hourly_charts():
+    profiler = profiling.current()
+
+    # Line chart section for hourly gas and electricity consumption
+    selected_month_for_hourly = st.selectbox("Select a month for Hourly Consumption Chart:", months)
+    selected_month_index = months.index(selected_month_for_hourly) + 1  # Get month number (1 for Jan, etc.)
+
+    # Hourly totals of every month are computed together: switching month is a lookup
+    hourly = get_profiles(data)['hour']
+
+    if selected_month_index not in hourly.index:
+        st.write(f"No data available for {selected_month_for_hourly}.")
     else:
-        st.write(f"No electricity data available for {selected_month_for_hourly}.")
+        hourly_gas_data = month_profile(hourly, selected_month_index, 'consommation_brute_gaz_totale')
+        hourly_electricity_data = month_profile(hourly, selected_month_index, 'consommation_brute_electricite_rte')
+
+        # Plot gas consumption per hour
+        if not hourly_gas_data.empty:
+            # Served from the figure cache once a month was drawn for any viewer
+            fig_hourly_gas = cached_figure("hourly gas", (selected_month_index,), data,
+                                           lambda: px.bar(hourly_gas_data, 
+                                                          labels={'x': "Hour of Day", 'y': "Total Gas Consumption (MWh)"},
+                                                          title=f"Hourly Gas Consumption for {selected_month_for_hourly}"))
+            profiler.plotly_chart("hourly gas", fig_hourly_gas)
+        else:
+            st.write(f"No gas data available for {selected_month_for_hourly}.")
+
+        # Plot electricity consumption per hour
+        if not hourly_electricity_data.empty:
+            fig_hourly_electricity = cached_figure("hourly electricity", (selected_month_index,), data,
+                                                   lambda: px.bar(hourly_electricity_data, 
+                                                                  labels={'x': "Hour of Day", 'y': "Total Electricity Consumption (MWh)"},
+                                                                  title=f"Hourly Electricity Consumption for {selected_month_for_hourly}"))
+            profiler.plotly_chart("hourly electricity", fig_hourly_electricity)
+        else:
+            st.write(f"No electricity data available for {selected_month_for_hourly}.")
+
+
+hourly_charts()
 
 st.write("""### Result interpretation
 The gas usage follows a typical daily pattern with high consumption in the morning and gradual decrease. 
@@ -78,28 +88,38 @@ This chart compares daily gas and electricity consumption. We can observe that d
 However, gas consumption tends to surpass electricity consumption overall. Noticeable drops occur on significant event days like July 14 and December 25.
 """)
 
-# Stacked chart for daily gas and electricity consumption
-selected_month_for_daily = st.selectbox("Select a month for Daily Stacked Chart:", months)
 
-# Filter data for the selected month
-selected_month_index = months.index(selected_month_for_daily) + 1
-month_data = df[df['date'].dt.month == selected_month_index]
+@profiling.fragment("daily")
+def daily_chart():
+    profiler = profiling.current()
+
+    # Stacked chart for daily gas and electricity consumption
+    selected_month_for_daily = st.selectbox("Select a month for Daily Stacked Chart:", months)
+
+    # Look the selected month up in the daily profiles of all months
+    selected_month_index = months.index(selected_month_for_daily) + 1
+    daily = get_profiles(data)['day']
+
+    if selected_month_index in daily.index:
+        daily_gas = month_profile(daily, selected_month_index, 'consommation_brute_gaz_totale')
+        daily_electricity = month_profile(daily, selected_month_index, 'consommation_brute_electricite_rte')
 
-if not month_data.empty:
-    daily_gas = month_data.groupby(month_data['date'].dt.day)['consommation_brute_gaz_totale'].sum()
-    daily_electricity = month_data.groupby(month_data['date'].dt.day)['consommation_brute_electricite_rte'].sum()
+        if not daily_gas.empty and not daily_electricity.empty:
+            def stacked_figure():
+                fig_stacked = px.area(x=daily_gas.index, 
+                                      y=[daily_gas.values, daily_electricity.values],
+                                      labels={'x': "Day of Month", 'y': "Total Consumption (MWh)"},
+                                      title=f"Daily Energy Consumption (Gas vs Electricity) for {selected_month_for_daily}")
+                return fig_stacked.update_layout(legend_title="Energy Source", showlegend=True)
 
-    if not daily_gas.empty and not daily_electricity.empty:
-        fig_stacked = px.area(x=daily_gas.index, 
-                              y=[daily_gas.values, daily_electricity.values],
-                              labels={'x': "Day of Month", 'y': "Total Consumption (MWh)"},
-                              title=f"Daily Energy Consumption (Gas vs Electricity) for {selected_month_for_daily}")
-        fig_stacked.update_layout(legend_title="Energy Source", showlegend=True)
-        st.plotly_chart(fig_stacked)
+            profiler.plotly_chart("daily stacked", cached_figure("daily stacked", (selected_month_index,), data, stacked_figure))
+        else:
+            st.write(f"No data available for gas and electricity in {selected_month_for_daily}.")
     else:
-        st.write(f"No data available for gas and electricity in {selected_month_for_daily}.")
-else:
-    st.write(f"No data available for {selected_month_for_daily}.")
+        st.write(f"No data available for {selected_month_for_daily}.")
+
+
+daily_chart()
 
 st.write("""### Result interpretation
 The data reveals the strong impact of seasonal events on energy consumption, particularly with large drops in both gas and electricity use during major holidays like July 14 and December 25.
@@ -111,28 +131,76 @@ It provides better insight into gas usage during colder months, as people tend t
 """)
 
 
-# Ratio chart for gas to electricity consumption
-selected_month_for_ratio = st.selectbox("Select a month for Gas to Electricity Ratio Chart:", months)
+@profiling.fragment("ratio")
+def ratio_chart():
+    profiler = profiling.current()
+
+    # Ratio chart for gas to electricity consumption
+    selected_month_for_ratio = st.selectbox("Select a month for Gas to Electricity Ratio Chart:", months)
 
-# Filter data for the selected month
-selected_month_index = months.index(selected_month_for_ratio) + 1
-month_data = df[df['date'].dt.month == selected_month_index]
+    # Look the selected month up in the ratio profiles of all months
+    selected_month_index = months.index(selected_month_for_ratio) + 1
+    ratios = get_profiles(data)['ratio']
 
-if not month_data.empty:
-    # Calculate the ratio of gas to electricity consumption
-    month_data['gas_to_electricity_ratio'] = month_data['consommation_brute_gaz_totale'] / month_data['consommation_brute_electricite_rte']
-    daily_ratio = month_data.groupby(month_data['date'].dt.day)['gas_to_electricity_ratio'].mean()
+    if selected_month_index in ratios.index:
+        # The cube stores the gas to electricity ratio of every row, averaged here per day
+        daily_ratio = month_profile(ratios, selected_month_index, 'gas_to_electricity_ratio')
 
-    if not daily_ratio.empty:
-        fig_ratio = px.line(daily_ratio, 
-                            labels={'x': "Day of Month", 'y': "Gas to Electricity Ratio"},
-                            title=f"Daily Gas to Electricity Consumption Ratio for {selected_month_for_ratio}")
-        st.plotly_chart(fig_ratio)
+        if not daily_ratio.empty:
+            fig_ratio = cached_figure("daily ratio", (selected_month_index,), data,
+                                      lambda: px.line(daily_ratio, 
+                                                      labels={'x': "Day of Month", 'y': "Gas to Electricity Ratio"},
+                                                      title=f"Daily Gas to Electricity Consumption Ratio for {selected_month_for_ratio}"))
+            profiler.plotly_chart("daily ratio", fig_ratio)
+        else:
+            st.write(f"No data available for gas to electricity ratio in {selected_month_for_ratio}.")
     else:
-        st.write(f"No data available for gas to electricity ratio in {selected_month_for_ratio}.")
-else:
-    st.write(f"No data available for {selected_month_for_ratio}.")
+        st.write(f"No data available for {selected_month_for_ratio}.")
+
+
+ratio_chart()
 
 st.write("""### Result interpretation
 The ratio chart clearly shows the increased use of gas compared to electricity during colder months, reflecting the demand for heating in such conditions.
-""")
\ No newline at end of file
+""")
+
+st.write("""### All Months Side by Side
+These small multiples show one profile for the twelve months at once, to compare their shapes across the year 
+without switching months.
+""")
+
+# Profile shown by the small multiples: (profile, column)
+SMALL_MULTIPLES = {
+    'Hourly gas consumption': ('hour', 'consommation_brute_gaz_totale'),
+    'Hourly electricity consumption': ('hour', 'consommation_brute_electricite_rte'),
+    'Daily gas consumption': ('day', 'consommation_brute_gaz_totale'),
+    'Daily electricity consumption': ('day', 'consommation_brute_electricite_rte'),
+    'Gas to electricity ratio': ('ratio', 'gas_to_electricity_ratio'),
+}
+
+
+@profiling.fragment("small multiples")
+def small_multiples_chart():
+    profiler = profiling.current()
+
+    selected_profile = st.selectbox("Select a profile to compare across months:", list(SMALL_MULTIPLES))
+    profile, column = SMALL_MULTIPLES[selected_profile]
+
+    def small_multiples_figure():
+        # The month x hour (or day) pivot in long form, one facet per month
+        pivot = get_profiles(data)[profile][column]
+        key = pivot.columns.name
+        long_form = (pivot.rename(index=lambda m: calendar.month_name[m]).rename_axis(index='month').reset_index()
+                     .melt(id_vars='month', var_name=key, value_name=column).dropna())
+        fig = px.line(long_form, x=key, y=column, facet_col='month', facet_col_wrap=4, height=700,
+                      title=f"{selected_profile} by Month")
+        fig.for_each_annotation(lambda a: a.update(text=a.text.split('=')[-1]))
+        return fig
+
+    profiler.plotly_chart("small multiples", cached_figure("small multiples", (selected_profile,), data,
+                                                           small_multiples_figure))
+
+
+small_multiples_chart()
+
+profiler.finish()